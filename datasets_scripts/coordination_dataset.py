@@ -10,99 +10,162 @@ Date: 14/03/2023
 ### 0 ### Imports
 
 # import some required libraries
+import argparse
 import pandas as pd
+import numpy as np
 
 # import the CEIPoM data
-from CEIPoM_import import CEIPoM
-from syntax_query import TreeSearch
-syntax = TreeSearch(CEIPoM)
-
-
-### 1 ### Get the raw data for coordination in CEIPoM
-
-# Get coordinating tokens and iterate over them
-coords = list(CEIPoM[CEIPoM["Relation"] == "COORD"].index)
-coord_data = []
-
-for c in coords:
-    row = [c]
-    
-    # Get the token and lemma
-    row.append(syntax.lemma(c))
-    row.append(syntax.token(c))
-
-    # Get its relevant children
-    children = syntax.direct_aux_co_children(c)
-    if len(children) > 0:
-        
-        # Count the coordinands
-        row.append(len(children))
-    
-        # Get the most common relation of its children
-        row.append(max(set([syntax.relation(i) for i in children]), key = [syntax.relation(i) for i in children].count))
-
-        # Get the most common part of speech of its children
-        row.append(max(set([syntax.information("Part_of_speech",i) for i in children]), key = [syntax.information("Part_of_speech",i) for i in children].count))
-    
-        # Get the most common semantic category of its children
-        row.append(max(set([syntax.information("Meaning_category",i) for i in children]), key = [syntax.information("Meaning_category",i) for i in children].count))
-    
-    else:
-        row += ["NA","NA","NA","NA"]
-    
-    # Check if there are AuxY's among the topological children and how many
-    row.append(len([i for i in syntax.direct_tree_children(c) if syntax.relation(i) == "AuxY"]))
-    
-    # Get other info
-    row.append(syntax.information("Language_(text)",c))
-    row.append(syntax.information("Date_before",c))
-    row.append(syntax.information("Date_after",c))
-    row.append(syntax.information("Sentence",c))
-    
-    # add this iteration to the data 
-    coord_data.append(row)
-    
-# aggregate the information into a dataframe
-data = pd.DataFrame(coord_data,columns=["Token_ID","Lemma","Token","Children","Relation","POS","Category","AuxY","Language","Date_before","Date_after","Sentence"])
-
-
-### 2 ### Enrich the CEIPoM dataframe
-
-# specify if the coordinands are names
-data["Proper"] = [1 if i == "PROPER" else 0 for i in list(data["Category"])]
-
-# specify if the coordinands are verbal
-data["Verbs"] = [1 if i == "verb" else 0 for i in list(data["POS"])]
-
-# specify if the coordinands are non-proper nominals
-data["Nouns"] = [1 if i == "noun" and j != "PROPER" else 0 for i,j in zip(list(data["POS"]),list(data["Category"]))]
-
-# specify if the coordination is polysyndetic
-data["Polysyndeton"] = [1 if type(i) != str and i > 2 else 0 for i in list(data["Children"])]
-
-# specify number of conjunctions
-data["Bisyndeton"] = [1 if type(i) != str and i-1 == j else 0 for i,j in zip(list(data["Children"]),list(data["AuxY"]))]
-
-# specify minus one strategy
-data["Minus_one"] = [1 if type(i) != str and i-2 == j else 0 for i,j in zip(list(data["Children"]),list(data["AuxY"]))]
-
-# label lexical nature of coordination strategies
-primary = ["12472a","10362a","15180a","14490a"]
-secondary = ["10385a","13568a","14730a","14512a"]
-
-types = []
-for l in list(data["Lemma"]):
-    if l == "" or l == "-":
-        types.append("A")
-    elif l in primary:
-        types.append("P")
-    elif l in secondary:
-        types.append("S")
-    else:
-        types.append("O")
-data["Strategy"] = types
+from session import Session
+from syntax_query import TreeSearch, adapt_columns
+from incremental import rebuild
+
+
+### 1 ### Define some helper functions
+
+# Get the relevant children of a list of coordinators, and count the AuxY's
+# among their topological children; run over sentence shards in parallel
+def coordinands(search, ids):
+    return [(search.direct_aux_co_children(c), list(search.relations(search.direct_tree_children(c))).count("AuxY")) for c in ids]
+
+# Get the most common item of a list
+def most_common(l):
+    return max(set(l), key = l.count)
+
+
+### 2 ### Build the dataset from (part of) CEIPoM
+
+def build(CEIPoM, search=None, processes=None):
+
+    ### 2.1 ### Get the raw data for coordination in CEIPoM
+
+    # create a TreeSearch object (unless one over this frame is given)
+    syntax = TreeSearch(CEIPoM) if search is None else search
+
+    # Get coordinating tokens and their relevant children
+    coords = list(CEIPoM[CEIPoM["Relation"] == "COORD"].index)
+    found = syntax.map_shards(coordinands, coords, processes)
+    children = [l for l, n in found]
+    auxy = [n for l, n in found]
+
+    # Gather the information about all children in one go, then split it per coordinator
+    flat = [i for l in children for i in l]
+    bounds = np.cumsum([0] + [len(l) for l in children])
+    child_relations = syntax.relations(flat).tolist()
+    child_pos = syntax.info_many("Part_of_speech", flat).tolist()
+    child_categories = syntax.info_many("Meaning_category", flat).tolist()
+
+    # Gather the information about the coordinators themselves
+    lemmas = syntax.lemmas(coords).tolist()
+    tokens = syntax.info_many("Token", coords).tolist()
+    languages = syntax.info_many("Language_(text)", coords).tolist()
+    dates_before = syntax.info_many("Date_before", coords).tolist()
+    dates_after = syntax.info_many("Date_after", coords).tolist()
+    sentences = syntax.info_many("Sentence", coords).tolist()
+
+    coord_data = []
+    for n, c in enumerate(coords):
+        row = [c]
+
+        # Get the token and lemma
+        row.append(lemmas[n])
+        row.append(tokens[n])
+
+        # Get its relevant children
+        a, b = bounds[n], bounds[n+1]
+        if b > a:
+
+            # Count the coordinands
+            row.append(int(b - a))
+
+            # Get the most common relation of its children
+            row.append(most_common(child_relations[a:b]))
+
+            # Get the most common part of speech of its children
+            row.append(most_common(child_pos[a:b]))
+
+            # Get the most common semantic category of its children
+            row.append(most_common(child_categories[a:b]))
+
+        else:
+            row += ["NA","NA","NA","NA"]
+
+        # Check if there are AuxY's among the topological children and how many
+        row.append(auxy[n])
+
+        # Get other info
+        row.append(languages[n])
+        row.append(dates_before[n])
+        row.append(dates_after[n])
+        row.append(sentences[n])
+
+        # add this iteration to the data 
+        coord_data.append(row)
+
+    # aggregate the information into a dataframe
+    data = pd.DataFrame(coord_data,columns=["Token_ID","Lemma","Token","Children","Relation","POS","Category","AuxY","Language","Date_before","Date_after","Sentence"])
+
+
+    ### 2.2 ### Enrich the CEIPoM dataframe
+
+    # specify if the coordinands are names
+    data["Proper"] = [1 if i == "PROPER" else 0 for i in list(data["Category"])]
+
+    # specify if the coordinands are verbal
+    data["Verbs"] = [1 if i == "verb" else 0 for i in list(data["POS"])]
+
+    # specify if the coordinands are non-proper nominals
+    data["Nouns"] = [1 if i == "noun" and j != "PROPER" else 0 for i,j in zip(list(data["POS"]),list(data["Category"]))]
+
+    # specify if the coordination is polysyndetic
+    data["Polysyndeton"] = [1 if type(i) != str and i > 2 else 0 for i in list(data["Children"])]
+
+    # specify number of conjunctions
+    data["Bisyndeton"] = [1 if type(i) != str and i-1 == j else 0 for i,j in zip(list(data["Children"]),list(data["AuxY"]))]
+
+    # specify minus one strategy
+    data["Minus_one"] = [1 if type(i) != str and i-2 == j else 0 for i,j in zip(list(data["Children"]),list(data["AuxY"]))]
+
+    # label lexical nature of coordination strategies
+    primary = ["12472a","10362a","15180a","14490a"]
+    secondary = ["10385a","13568a","14730a","14512a"]
+
+    types = []
+    for l in list(data["Lemma"]):
+        if l == "" or l == "-":
+            types.append("A")
+        elif l in primary:
+            types.append("P")
+        elif l in secondary:
+            types.append("S")
+        else:
+            types.append("O")
+    data["Strategy"] = types
+
+    return {"coordination_dataset": data}
+    # builds the dataset for the coordinators of a CEIPoM frame; every row only
+    # depends on its own sentence, so texts can be built separately
 
 
 ### 3 ### export the dataframe
-data.to_csv("datasets_automatic/coordination_dataset.csv", sep=";", encoding="utf-8")
+
+# only the texts which are new or have changed since the last run are analysed
+# again (set incremental to False to rebuild every row from scratch)
+incremental = True
+
+def main(session=None, processes=None):
+
+    # use the corpus and tree search of a session (or load them), with integer
+    # Head, Sentence_ID and Token_ID columns as in the tree search; processes
+    # is the number of worker processes for the tree queries (all cores by default)
+    session = Session() if session is None else session
+    search = session.search
+    corpus = adapt_columns(session.corpus)
+    whole = lambda CEIPoM: build(CEIPoM, search if CEIPoM is corpus else None, processes)
+    data = rebuild("coordination_dataset", corpus, whole, depends=[build, TreeSearch], incremental=incremental)["coordination_dataset"]
+    data.to_csv("datasets_automatic/coordination_dataset.csv", sep=";", encoding="utf-8")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the coordination dataset.")
+    parser.add_argument("--processes", type=int, default=None, help="number of worker processes for the tree queries")
+    main(processes=parser.parse_args().processes)
 
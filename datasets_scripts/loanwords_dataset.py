@@ -18,9 +18,10 @@ data = pd.read_csv("datasets_manual/loanwords_italic.csv", sep=";")
 data = data[data["selection"] == "selection"].copy()
 data = data.dropna(subset=["latin_score"])
 
-# import PROIEL
+# import PROIEL (the four treebanks are parsed in parallel and merged)
+from syntax_query import TreeSearch
 texts = ["caes-gal.xml","cic-att.xml","cic-off.xml","latin-nt.xml"]
-proiel = [open("PROIEL/{}".format(i), 'r', encoding='utf-8').read() for i in texts]
+proiel = TreeSearch.from_files(["PROIEL/{}".format(i) for i in texts])
 
 # import WOLD
 wold = pd.read_csv("WOLD/forms.csv", sep=",")
@@ -35,11 +36,7 @@ def average(l):
 ### 1 ### Enrich with frequency data
 
 # get the lemma information from PROIEL
-proiel  = "".join(proiel)
-proiel = proiel.split("\n")
-proiel = [i for i in proiel if i.find('lemma="')>-1]
-proiel = [i[i.find('lemma="')+7:] for i in proiel]
-proiel = [i[:i.find('"')] for i in proiel]
+proiel = list(proiel.df["Lemma"])
 proiel = ["".join([i for i in j if i.lower() in "abcdefghijklmnopqrstuvwxyz"]) for j in proiel]
 
 # for each item in the Latin translation, get its frequency in the PROIEL list
@@ -11,6 +11,7 @@ Date: 14/03/2023
 
 # import required libraries
 import pandas as pd
+import numpy as np
 from asjp import tokenise
 
 # import the datasets
@@ -51,53 +52,70 @@ def distance(x,y,vw="no"):
     # return the calculated distance
     return dist
 
-# use the above distance metric to calculate a levenshtein distance between two strings
-def levenshtein(x, y, vw="no"):
-    
-    # split strings into constituent sounds
-    x = [i for i in tokenise(x)]
-    y = [i for i in tokenise(y)]
-
-    # create a matrix
-    length = list(range(len(y) + 1))
-    matrix = []
-    for i in length:
-        l = [i]*(len(x)+1)
-        matrix.append(l)
-    matrix[0] = list(range(len(x) + 1))
-    
-    # iterate over the matrix
+# number ASJP sounds once, keeping 0 for no sound (insertions and deletions)
+segments = {"": 0}
+
+def encode(forms):
+    tokens = [tokenise(i) for i in forms]
+    for t in tokens:
+        for i in t:
+            segments.setdefault(i, len(segments))
+    lengths = np.array([len(t) for t in tokens])
+    codes = np.zeros((len(forms), lengths.max(initial=0)), dtype=int)
+    for n, t in enumerate(tokens):
+        codes[n, :len(t)] = [segments[i] for i in t]
+    return codes, lengths
+    # turns a list of strings into a matrix of sound codes (one row per string,
+    # padded with 0) and the number of sounds in each string
+
+# keep the distances between all numbered sounds, per weighting
+matrices = {}
+
+def costs(vw="no"):
+    if vw not in matrices or len(matrices[vw]) < len(segments):
+        inventory = list(segments)
+        matrices[vw] = np.array([[distance(x, y, vw=vw) for y in inventory] for x in inventory])
+    return matrices[vw]
+    # the distance metric above for every pair of sound codes (column 0 giving
+    # the cost of deleting or inserting a sound), recomputed only for new sounds
+
+# use the above distance metric to calculate levenshtein distances between lists of strings
+def levenshtein(x, y, vw=("no", "yes")):
+
+    # split strings into constituent sounds, as numbers
+    x, m = encode(x)
+    y, n = encode(y)
+    cost = np.stack([costs(i) for i in vw])
+
+    # create a matrix for every pair of strings and weighting
     # coordinates are i (for rows), j (for columns)
+    matrix = np.zeros((len(vw), len(m), y.shape[1] + 1, x.shape[1] + 1))
+    matrix[:, :, 0, :] = np.arange(x.shape[1] + 1)
+    matrix[:, :, :, 0] = np.arange(y.shape[1] + 1)
 
-    for i in list(range(1,len(y) + 1)):
-        for j in list(range(1,len(x) + 1)):
-
-            # get the relevant sounds
-            k = y[i-1]
-            l = x[j-1]
+    # running totals of the cost of inserting the sounds of x
+    insert = np.zeros((len(vw), len(m), x.shape[1] + 1))
+    insert[:, :, 1:] = np.cumsum(cost[:, x, 0], axis=2)
 
-            # get the value of the squares above, left and left above diagonally, in the matrix
-            above = matrix[i-1][j]
-            leftab = matrix[i-1][j-1]
-            left = matrix[i][j-1]
+    # fill the matrix row by row, for all strings at once
+    for i in range(1, y.shape[1] + 1):
 
-            # get the phonological distances
-            var1 = distance(k,"",vw=vw) + above
-            var2 = distance(l,"",vw=vw) + left
-            var3 = distance(k,l,vw=vw) + leftab
+        # the best of coming from above (deleting k) or diagonally (substituting k by l)
+        k = y[:, i-1, None]
+        above = cost[:, k, 0] + matrix[:, :, i-1, 1:]
+        leftab = cost[:, k, x] + matrix[:, :, i-1, :-1]
+        best = np.minimum(above, leftab)
 
-            # add the smallest value to the matrix
-            matrix[i][j] = min([var1, var2, var3])
-
-    # the last cell represents the levenshtein distance
-    dist = matrix[-1][-1]
-    return dist
+        # then coming from the left (inserting l) as often as is cheaper
+        row = np.concatenate([matrix[:, :, i, :1], best], axis=2) - insert
+        matrix[:, :, i, :] = np.minimum.accumulate(row, axis=2) + insert
 
-# normalise levenshtein distance by the length of the longest string involved
-def normalise(d,x,y):
-    length = max(len(tokenise(x)),len(tokenise(y)))
-    d = d / length
-    return d
+    # the cell at the end of both strings represents the levenshtein distance,
+    # normalised by the length of the longest string involved
+    dist = matrix[:, np.arange(len(m)), n, m]
+    return dist / np.maximum(m, n)
+    # returns one row of normalised distances per weighting in vw, with one
+    # value per pair of strings
 
 
 ### 2 ### calculate modern distances
@@ -119,19 +137,11 @@ for p in pairs:
     x = list(subset["form_x"])
     y = list(subset["form_y"])
     
-    # get their regular levenshtein distance and normalise it
-    d = [levenshtein(x[i], y[i], vw="no") for i in range(len(x))]
-    l = [normalise(d[i], x[i], y[i]) for i in range(len(x))]
+    # get their regular and vowel-weighted levenshtein distances, normalised
+    d = levenshtein(x, y).tolist()
 
-    # take an average the normalised levenshtein distance
-    lev_regular = round(sum(l)/len(l),4)
-
-    # ditto for vowel-weighted levenshtein distance
-    d = [levenshtein(x[i], y[i],vw="yes") for i in range(len(x))]
-    l = [normalise(d[i], x[i], y[i]) for i in range(len(x))]
-
-    # ditto average
-    lev_vowel = round(sum(l)/len(l),4)
+    # take an average of each normalised levenshtein distance
+    lev_regular, lev_vowel = [round(sum(l)/len(l),4) for l in d]
 
     # append to the dataset
     modern.append([p, lev_regular, lev_vowel])
@@ -155,19 +165,11 @@ for p in pairs:
     x = list(subset[p[0]])
     y = list(subset[p[1]])
     
-    # get their regular levenshtein distance and normalise it
-    d = [levenshtein(x[i], y[i], vw="no") for i in range(len(x))]
-    l = [normalise(d[i], x[i], y[i]) for i in range(len(x))]
-
-    # take an average the normalised levenshtein distance
-    lev_regular = round(sum(l)/len(l),4)
-
-    # ditto for vowel-weighted levenshtein distance
-    d = [levenshtein(x[i], y[i],vw="yes") for i in range(len(x))]
-    l = [normalise(d[i], x[i], y[i]) for i in range(len(x))]
+    # get their regular and vowel-weighted levenshtein distances, normalised
+    d = levenshtein(x, y).tolist()
 
-    # ditto average
-    lev_vowel = round(sum(l)/len(l),4)
+    # take an average of each normalised levenshtein distance
+    lev_regular, lev_vowel = [round(sum(l)/len(l),4) for l in d]
 
     # append to the dataset
     ancient.append([p, lev_regular, lev_vowel])
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+"""
+Output: Timings of the CEIPoM merge (printed)
+Used in: Maintenance of CEIPoM_import.py
+"""
+
+
+### 0 ### Imports
+
+# import libraries
+import time
+import tracemalloc
+import pandas as pd
+
+# import the CEIPoM csv files and the current merge
+from CEIPoM_import import read_source, sources, merge_corpus
+
+
+### 1 ### The previous merge (four hash merges), kept for comparison
+
+def hash_merge(links, texts, sentences, tokens, analysis):
+    linkstemp = links.drop_duplicates(subset="Text_ID")
+    linkstemp = linkstemp.drop_duplicates(subset="Trismegistos_ID")
+    corpus = tokens.merge(analysis, on="Token_ID", how="left", suffixes=("","_delete"))
+    corpus = corpus.merge(sentences, on="Sentence_ID", suffixes=("","_delete"))
+    corpus = corpus.merge(texts, on="Text_ID", suffixes=("","_(text)"))
+    corpus = corpus.merge(linkstemp, on="Text_ID", how="left", suffixes=("","_delete"))
+    columns = [i for i in list(corpus.columns) if i.find("delete")==-1]
+    corpus = corpus[columns]
+    corpus = corpus.sort_values(by=["Text_ID","Sentence_position","Token_position"])
+    corpus["Trismegistos_ID"] = corpus["Trismegistos_ID"].fillna(0).astype(int)
+    corpus = corpus.drop_duplicates(subset="Token_ID")
+    return corpus.reset_index(drop=True)
+
+
+### 2 ### Time both merges on the same tables
+
+def measure(function, tables, repeats=5):
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        corpus = function(**tables)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    function(**tables)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return corpus, min(times), peak
+    # best wall time over a few runs, and the peak memory of one more run
+
+tables = {name: read_source(name) for name in sources}
+print("tokens: {}, analyses: {}".format(len(tables["tokens"]), len(tables["analysis"])))
+
+results = []
+for name, function in [("hash merges", hash_merge), ("indexed lookups", merge_corpus)]:
+    corpus, seconds, peak = measure(function, tables)
+    results.append(corpus)
+    print("{:<16} {:8.3f} s {:10.1f} MB peak".format(name, seconds, peak / 1e6))
+
+# both merges should give the same corpus
+pd.testing.assert_frame_equal(results[0], results[1])
+print("identical output")
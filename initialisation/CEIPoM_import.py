@@ -10,58 +10,432 @@ Date: 10/04/2023
 
 ### 0 ### necessary imports
 
-# import pandas
+# import pandas and some standard libraries for the cache and the loader
 import pandas as pd
+import functools
+import hashlib
+import json
+import os
+import pickle
+import re
+import warnings
 
-# import the CEIPoM csv files
-links = pd.read_csv("CEIPoM/links.csv",encoding="utf-16")
-texts = pd.read_csv("CEIPoM/texts.csv",encoding="utf-16")
-sentences = pd.read_csv("CEIPoM/sentences.csv",encoding="utf-16")
-tokens = pd.read_csv("CEIPoM/tokens.csv",encoding="utf-16")
-analysis = pd.read_csv("CEIPoM/analysis.csv",encoding="utf-16")
+# the CEIPoM csv files, and where the merged database is cached
+folder = "CEIPoM"
+sources = ["links", "texts", "sentences", "tokens", "analysis"]
+cache = os.path.join(folder, ".cache")
+
+def read_source(name, columns=None):
+    return pd.read_csv(os.path.join(folder, name + ".csv"), encoding="utf-16", usecols=columns)
+    # import a single CEIPoM csv file (optionally only some of its columns)
+
+def header(name):
+    return list(pd.read_csv(os.path.join(folder, name + ".csv"), encoding="utf-16", nrows=0).columns)
+    # the column names of a CEIPoM csv file
 
 
 ### 1 ### merge a single CEIPoM dataframe
 
-# get a single link per Trismegistos ID
-linkstemp = links.drop_duplicates(subset="Text_ID")
-linkstemp = linkstemp.drop_duplicates(subset="Trismegistos_ID")
+def attach(corpus, table, key, how="left", suffix=None):
+    if suffix is None:
+        table = table[[i for i in table.columns if i == key or i not in corpus.columns]]
+    else:
+        table = table.rename(columns={i: i + suffix for i in table.columns if i != key and i in corpus.columns})
+    if how == "inner":
+        corpus = corpus[corpus[key].isin(table[key]).values]
+    if not table[key].is_unique:
+        return corpus.merge(table, on=key, how=how)
+    table = table.set_index(key).reindex(corpus[key].values)
+    table.index = corpus.index
+    return pd.concat([corpus, table], axis=1)
+    # adds the columns of a table to the corpus by looking its rows up on a
+    # key; columns the corpus already has are left out (or renamed with the
+    # suffix), and an inner lookup first drops rows without a match, so the
+    # result equals a merge followed by dropping the duplicate columns
+
+def merge_corpus(links, texts, sentences, tokens, analysis):
+
+    # look the analyses (one per token), sentences, texts and links up
+    # (links and analysis can be left out)
+    corpus = tokens
+    if analysis is not None:
+        corpus = attach(corpus, analysis.drop_duplicates(subset="Token_ID"), "Token_ID")
+    corpus = attach(corpus, sentences, "Sentence_ID", how="inner")
+    corpus = attach(corpus, texts, "Text_ID", how="inner", suffix="_(text)")
+    if links is not None:
+
+        # get a single link per Trismegistos ID
+        linkstemp = links.drop_duplicates(subset="Text_ID")
+        linkstemp = linkstemp.drop_duplicates(subset="Trismegistos_ID")
+        corpus = attach(corpus, linkstemp, "Text_ID")
+
+    # delete columns marked as duplicates
+    if any(i.find("delete") > -1 for i in corpus.columns):
+        corpus = corpus[[i for i in list(corpus.columns) if i.find("delete")==-1]]
+
+    # sort the dataframe and drop any remaining duplicate tokens
+    corpus = corpus.sort_values(by=["Text_ID","Sentence_position","Token_position"])
+    if "Trismegistos_ID" in corpus.columns:
+        corpus["Trismegistos_ID"] = corpus["Trismegistos_ID"].fillna(0).astype(int)
+    corpus = corpus.drop_duplicates(subset="Token_ID")
+    return corpus.reset_index(drop=True)
+    # everything up to (but not including) filling in missing values and
+    # setting column types, which is what gets cached
+
+# the keys each csv file is joined and sorted on, and the order of the merge
+keys = {"tokens": ["Token_ID", "Sentence_ID", "Token_position"],
+        "analysis": ["Token_ID"],
+        "sentences": ["Sentence_ID", "Text_ID", "Sentence_position"],
+        "texts": ["Text_ID"],
+        "links": ["Text_ID", "Trismegistos_ID"]}
+joins = {"tokens": None, "analysis": "Token_ID", "sentences": "Sentence_ID", "texts": "Text_ID", "links": "Text_ID"}
+
+def layout():
+    output = {}
+    seen = set()
+    for name in joins:
+        output[name] = {}
+        for column in header(name):
+            final = column
+            if column in seen and column != joins[name]:
+                final = column + "_(text)" if name == "texts" else None
+            if final is not None and final.find("delete") > -1:
+                final = None
+            output[name][column] = final
+        seen.update(i for i in output[name].values() if i is not None)
+    return output
+    # the name each column of each csv file gets in the merged corpus (None if
+    # merge_corpus throws it away), read from the csv headers only
+
 
-# merge the CEIPoM files together
-corpus = tokens.merge(analysis, on="Token_ID", how="left", suffixes=("","_delete"))
-corpus = corpus.merge(sentences, on="Sentence_ID", suffixes=("","_delete"))
-corpus = corpus.merge(texts, on="Text_ID", suffixes=("","_(text)"))
-corpus = corpus.merge(linkstemp, on="Text_ID", how="left", suffixes=("","_delete"))
+### 2 ### cache the merged dataframe
 
+def fingerprints(known):
+    output = {}
+    for name in sources:
+        path = os.path.join(folder, name + ".csv")
+        stat = os.stat(path)
+        old = known.get(name, {})
+        if old.get("size") == stat.st_size and old.get("mtime") == stat.st_mtime_ns:
+            digest = old.get("sha1")
+        else:
+            digest = hashlib.sha1()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+            digest = digest.hexdigest()
+        output[name] = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "sha1": digest}
+    return output
+    # size, modification time and hash of each csv file; files whose size and
+    # mtime are unchanged aren't rehashed
 
-### 2 ### sort the dataframe out
+def unchanged(current, known):
+    key = lambda prints: {name: (p["size"], p["sha1"]) for name, p in prints.items()}
+    return key(current) == key(known)
+    # compares two sets of fingerprints by size and hash (a file that was only
+    # touched doesn't invalidate the cache)
 
-# delete duplicate columns
-columns = [i for i in list(corpus.columns) if i.find("delete")==-1]
-corpus = corpus[columns]
+def write_frame(df, name):
+    path = os.path.join(cache, name)
+    temporary = "{}.{}.tmp".format(path, os.getpid())
+    try:
+        df.to_feather(temporary)
+        os.replace(temporary, path + ".feather")
+        return "feather"
+    except Exception:
+        df.to_pickle(temporary)
+        os.replace(temporary, path + ".pickle")
+        return "pickle"
+    # write a dataframe to the cache as feather (needs pyarrow), falling back
+    # on pickle if pyarrow is missing or the frame has mixed-type columns; the
+    # file is written under a temporary name first, so that scripts running
+    # side by side never read a half-written cache
 
-# sort the dataframe and fill NaN values
-corpus = corpus.sort_values(by=["Text_ID","Sentence_position","Token_position"])
-corpus["Trismegistos_ID"] = corpus["Trismegistos_ID"].fillna(0).astype(int)
-CEIPoM = corpus.fillna("")
+def write_manifest(content):
+    path = os.path.join(cache, "manifest.json")
+    temporary = "{}.{}.tmp".format(path, os.getpid())
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(content, f)
+    os.replace(temporary, path)
+    # ditto for the manifest, which is written after the frame it describes
 
-# drop duplicate morphological analyses
-CEIPoM = CEIPoM.drop_duplicates(subset="Token_ID")
-CEIPoM["Token_IDs"] = CEIPoM["Token_ID"]
-CEIPoM = CEIPoM.set_index('Token_IDs')
-CEIPoM.index.name = None
+def read_frame(name, form, columns=None):
+    path = os.path.join(cache, name + "." + form)
+    if form == "feather":
+        import pyarrow.feather
+        return pyarrow.feather.read_feather(path, columns=columns, memory_map=True)
+    df = pd.read_pickle(path)
+    return df if columns is None else df[columns]
+    # read a dataframe (or some of its columns) back from the cache
+
+def read_manifest():
+    manifest = os.path.join(cache, "manifest.json")
+    if not os.path.exists(manifest):
+        return {}
+    with open(manifest, encoding="utf-8") as f:
+        return json.load(f)
+    # the fingerprints and formats of the cached frames (empty if there are none)
+
+def cached(name, columns=None):
+    known = read_manifest()
+    current = fingerprints(known.get("sources", {}))
+    formats = known.get("formats", {})
+    if not set(["corpus", "texts"]) <= set(formats) or "columns" not in known or not unchanged(current, known["sources"]):
+        return None
+    if columns is not None:
+        columns = [i for i in known.get("columns", {}).get(name, []) if i in columns]
+    try:
+        frame = read_frame(name, formats[name], columns)
+    except (OSError, ValueError, KeyError, EOFError, ImportError, pickle.UnpicklingError) as error:
+        warnings.warn("CEIPoM cache not read ({}: {}), using the csv files".format(type(error).__name__, error))
+        return None
+    if current != known["sources"]:
+        write_manifest(dict(known, sources=current))
+    return frame
+    # the corpus or the texts table from the cache (optionally only the columns
+    # of it in a list), if the csv files haven't changed since it was written
+    # (None otherwise, without rebuilding); a cache file which is missing,
+    # damaged or unreadable here (pyarrow's errors are OSErrors and
+    # ValueErrors) is reported and treated as out of date, while anything
+    # else is a bug and is raised
+
+def load_cached(name="corpus"):
+    frame = cached(name)
+    if frame is not None:
+        return frame
+    current = fingerprints(read_manifest().get("sources", {}))
+    tables = {name: read_source(name) for name in sources}
+    frames = {"corpus": prepare(merge_corpus(**tables)), "texts": tables["texts"]}
+    try:
+        os.makedirs(cache, exist_ok=True)
+        formats = {i: write_frame(frame, i) for i, frame in frames.items()}
+        columns = {i: [str(c) for c in frame.columns] for i, frame in frames.items()}
+        write_manifest({"sources": current, "formats": formats, "columns": columns})
+    except OSError:
+        pass
+    return frames[name]
+    # ditto, but rebuilding (and caching) both frames if the cache is missing
+    # or out of date; the corpus is cached re-dated and typed, so that loading
+    # it needs no further conversion
+
+def load_corpus():
+    return load_cached("corpus")
 
 
 ### 3 ### assign a chronological stratification to the Iguvine Tables
 
-dbefore = list(CEIPoM["Date_before"])
-dafter = list(CEIPoM["Date_after"])
-for i in range(len(CEIPoM)):
-	if str(CEIPoM.iloc[i]["Section"]).find("Latin alphabet") > -1:
-		dbefore[i] = -150
-		dafter[i] = -100
-CEIPoM = CEIPoM.copy()
-CEIPoM["Date_before"] = dbefore
-CEIPoM["Date_after"] = dafter
-CEIPoM = CEIPoM.copy()
+# date corrections: rows whose column contains the pattern get these dates
+redatings = pd.DataFrame([
+    ["Section", "Latin alphabet", -150, -100],
+], columns=["Column", "Pattern", "Date_before", "Date_after"])
+
+def stratify(df):
+    df = df.copy()
+    for rule in redatings.itertuples():
+        if rule.Column not in df.columns:
+            continue
+        mask = df[rule.Column].astype(str).str.contains(rule.Pattern, regex=False).values
+        df.loc[mask, "Date_before"] = rule.Date_before
+        df.loc[mask, "Date_after"] = rule.Date_after
+    df["Date_before"] = df["Date_before"].infer_objects()
+    df["Date_after"] = df["Date_after"].infer_objects()
+    return df
+    # works on anything with Date columns (the corpus, or the sentences when
+    # filtering by date); later rules win where patterns overlap
+
+
+### 4 ### give the merged dataframe compact column types
+
+# categoricals for repetitive strings, (nullable) integers for ids, positions
+# and dates, and float32 for coordinates; any other column is left as it is
+schema = {
+    "Token_ID": "int32", "Sentence_ID": "int32", "Text_ID": "int32",
+    "Analysis_ID": "Int32", "Head": "Int32", "Token_position": "Int32", "Sentence_position": "Int32",
+    "Trismegistos_ID": "Int32", "Text_length": "Int32", "Date_before": "Int32", "Date_after": "Int32",
+    "Latitude": "float32", "Longitude": "float32",
+    "Language": "category", "Language_(text)": "category", "Language_family": "category",
+    "Relation": "category", "Part_of_speech": "category", "Case": "category", "Number": "category",
+    "Meaning_category": "category", "Section": "category"}
+
+def typed(df):
+    df = df.copy()
+    for column in df.columns:
+        dtype = schema.get(column)
+        if dtype is None:
+            df[column] = df[column].fillna("")
+        elif dtype == "category":
+            df[column] = df[column].fillna("").astype("category")
+        else:
+            df[column] = pd.to_numeric(df[column], errors="coerce").astype(dtype)
+    return df
+    # missing values become "" in string columns (so comparisons with "" keep
+    # working) and <NA> in numeric ones
+
+def prepare(corpus):
+    if set(["Section", "Date_before", "Date_after"]) <= set(corpus.columns):
+        corpus = stratify(corpus)
+    return typed(corpus)
+    # re-date the Iguvine Tables (where the corpus has the columns for it) and
+    # apply the schema
+
+
+### 5 ### load (parts of) the database lazily
+
+class Database:
+
+    def __init__(self, columns=None, languages=None, dates=None, tables=None):
+        self.columns = None if columns is None else list(columns)
+        self.languages = [languages] if isinstance(languages, str) else languages
+        self.dates = dates
+        self.tables = sources if tables is None else list(tables)
+        self.restricted = any(i is not None for i in [columns, languages, dates, tables])
+        self.filtered = languages is not None or dates is not None
+        # nothing is read until an attribute is first used; without any
+        # arguments the full corpus comes from the cache
+
+    @functools.cached_property
+    def layout(self):
+        return layout()
+
+    def selected(self, name):
+        extra = []
+        if self.columns is not None and set(self.columns) & {"Date_before", "Date_after"}:
+            extra = ["Section", "Date_before", "Date_after"]
+        output = []
+        for column, final in self.layout[name].items():
+            if final is None:
+                continue
+            if name in self.tables and (self.columns is None or final in self.columns):
+                output.append(column)
+            elif final in extra:
+                output.append(column)
+        return output
+        # the columns of a csv file that end up in the requested corpus (plus
+        # whatever the Iguvine dates depend on)
+
+    def usecols(self, name):
+        wanted = set(keys[name]) | set(self.selected(name))
+        return [i for i in self.layout[name] if i in wanted]
+        # the same with the join and sort keys added
+
+    def renamed(self, name, df):
+        columns = self.usecols(name)
+        return df[columns].rename(columns={i: self.layout[name][i] for i in columns})
+        # give the columns of a (small) table their merged names up front
+
+    @functools.cached_property
+    def selection(self):
+        texts = read_source("texts")
+        sentences = None
+        if self.languages is not None:
+            pattern = "|".join(re.escape(i) for i in self.languages)
+            texts = texts[texts["Language"].str.contains(pattern, na=False)]
+        if self.dates is not None:
+            sentences = read_source("sentences")
+            sentences = sentences[sentences["Text_ID"].isin(texts["Text_ID"])]
+            dated = sentences[["Sentence_ID", "Text_ID", "Section"]]
+            dated = dated.merge(texts[["Text_ID", "Date_before", "Date_after"]], on="Text_ID", how="left")
+            dated = stratify(dated)
+            earliest, latest = self.dates
+            dates = dated[["Date_after", "Date_before"]].astype(float)
+            keep = dates.notna().any(axis=1)
+            if earliest is not None:
+                keep = keep & (dates.max(axis=1) >= earliest)
+            if latest is not None:
+                keep = keep & (dates.min(axis=1) <= latest)
+            sentences = sentences[keep.values]
+            texts = texts[texts["Text_ID"].isin(sentences["Text_ID"])]
+        return texts, sentences
+        # the texts (by text language) and sentences (by dating, Iguvine
+        # Tables included, overlapping the interval) that pass the filters
+
+    @functools.cached_property
+    def texts(self):
+        if self.filtered:
+            return self.selection[0]
+        texts = cached("texts")
+        return read_source("texts") if texts is None else texts
+        # the whole texts table comes from the cache where it is up to date;
+        # a missing or stale cache is only rebuilt by a load of the full corpus
+
+    @functools.cached_property
+    def sentences(self):
+        if self.dates is not None:
+            return self.selection[1]
+        sentences = read_source("sentences")
+        if self.filtered:
+            sentences = sentences[sentences["Text_ID"].isin(self.texts["Text_ID"])]
+        return sentences
+
+    @functools.cached_property
+    def tokens(self):
+        tokens = read_source("tokens", self.usecols("tokens"))
+        if self.filtered:
+            tokens = tokens[tokens["Sentence_ID"].isin(self.sentences["Sentence_ID"])]
+        return tokens
+        # only the columns needed for the merged corpus are read
+
+    @functools.cached_property
+    def analysis(self):
+        analysis = read_source("analysis", self.usecols("analysis"))
+        if self.filtered:
+            analysis = analysis[analysis["Token_ID"].isin(self.tokens["Token_ID"])]
+        return analysis
+
+    @functools.cached_property
+    def links(self):
+        links = read_source("links")
+        if self.filtered:
+            links = links[links["Text_ID"].isin(self.texts["Text_ID"])]
+        return links
+
+    @functools.cached_property
+    def corpus(self):
+        if not self.restricted:
+            return load_corpus()
+        analysis = None
+        if len(self.selected("analysis")) > 0:
+            analysis = self.analysis
+        links = None
+        if len(self.selected("links")) > 0:
+            links = read_source("links", self.usecols("links"))
+            links = links.drop_duplicates(subset="Text_ID")
+            links = links.drop_duplicates(subset="Trismegistos_ID")
+            links = links[links["Text_ID"].isin(self.texts["Text_ID"])]
+        texts = self.renamed("texts", self.texts)
+        sentences = self.renamed("sentences", self.sentences)
+        return prepare(merge_corpus(links, texts, sentences, self.tokens, analysis))
+        # the merged corpus, re-dated and typed; links are reduced to one per
+        # Trismegistos ID before filtering, as in the full merge
+
+    @functools.cached_property
+    def CEIPoM(self):
+
+        # read only the requested columns from the cache where that is enough
+        CEIPoM = None
+        if self.columns is not None and not self.filtered and self.tables == sources:
+            CEIPoM = cached("corpus", self.columns + ["Token_ID"])
+        if CEIPoM is None:
+            CEIPoM = self.corpus
+
+        # index by Token_ID and keep the requested columns
+        CEIPoM = CEIPoM.set_index(pd.Index(CEIPoM["Token_ID"].to_numpy(dtype="int64")))
+        if self.columns is not None:
+            CEIPoM = CEIPoM[[i for i in self.columns if i in CEIPoM.columns]]
+        return CEIPoM
+
+def load_ceipom(columns=None, languages=None, dates=None, tables=None):
+    return Database(columns, languages, dates, tables)
+    # columns: the corpus columns needed (merged names, e.g. "Language_(text)")
+    # languages: a language or list of languages the text language contains
+    # dates: an (earliest, latest) interval the dating should overlap
+    # tables: the csv files whose columns go into the corpus (tokens,
+    # sentences and texts are always joined on their keys)
+
+# the full database, loaded when first used (from CEIPoM_import import CEIPoM)
+database = load_ceipom()
 
+def __getattr__(name):
+    if name in ["CEIPoM", "corpus", "links", "texts", "sentences", "tokens", "analysis"]:
+        return getattr(database, name)
+    raise AttributeError("module {} has no attribute {}".format(__name__, name))
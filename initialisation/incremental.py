@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+"""
+Output: Incremental rebuilds of the CEIPoM datasets
+Used in: datasets_scripts
+"""
+
+
+### 0 ### necessary imports
+
+# import pandas and some standard libraries for the cache
+import pandas as pd
+import numpy as np
+import hashlib
+import inspect
+import os
+
+# where the per-text results of the dataset scripts are kept
+cache = os.path.join("datasets_automatic", ".cache")
+
+
+### 1 ### fingerprint the texts of the corpus
+
+def text_fingerprints(corpus, key="Text_ID"):
+    rows = pd.util.hash_pandas_object(corpus, index=True).to_numpy()
+    codes, texts = pd.factorize(corpus[key])
+    order = np.argsort(codes, kind="stable")
+    bounds = np.cumsum(np.bincount(codes[codes >= 0], minlength=len(texts)))[:-1]
+    chunks = np.split(rows[order][codes[order] >= 0], bounds)
+    schema = repr([(str(c), str(t)) for c, t in corpus.dtypes.items()]).encode("utf-8")
+    return {t: hashlib.sha1(schema + chunk.tobytes()).hexdigest() for t, chunk in zip(texts.tolist(), chunks)}
+    # a hash of all rows (index and values) of every text, in corpus order; a
+    # change to the columns or their types changes every fingerprint
+
+def version(depends):
+    digest = hashlib.sha1()
+    for thing in depends:
+        with open(inspect.getsourcefile(thing), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+    # a hash of the source files of the functions and classes a build relies
+    # on, so that changes to the code invalidate the stored results
+
+
+### 2 ### rebuild datasets text by text
+
+def positions(corpus, frame, name, token="Token_ID"):
+    indexer = corpus.index.get_indexer(frame[token])
+    if (indexer < 0).any():
+        missing = frame[token].to_numpy()[indexer < 0]
+        raise ValueError("{}: {} rows have a {} which is not in the corpus index (e.g. {})".format(name, len(missing), token, ", ".join(str(i) for i in missing[:5])))
+    return indexer
+    # the corpus row of every row of a dataset, through its token column; rows
+    # can't be tied to a text without one, so a token missing from the corpus
+    # is an error rather than being silently given to the wrong text
+
+def splice(old, new, owners, corpus, name, token="Token_ID"):
+    frames = [f for f in [old, new] if len(f) > 0] or [new]
+    frame = pd.concat(frames) if len(frames) > 1 else frames[0]
+    order = np.argsort(positions(corpus, frame, name, token), kind="stable")
+    frame = frame.iloc[order]
+    if isinstance(new.index, pd.RangeIndex):
+        frame = frame.reset_index(drop=True)
+    return frame, owners[order]
+    # combine stored and freshly built rows in the order of their tokens in the
+    # corpus (renumbering frames with a plain row number index)
+
+def rebuild(name, corpus, build, depends=(), incremental=True, key="Text_ID", token="Token_ID"):
+    if not incremental:
+        return build(corpus)
+    path = os.path.join(cache, name + ".pickle")
+    current = text_fingerprints(corpus, key)
+    stamp = version(list(depends) + [rebuild])
+    known = None
+    if os.path.exists(path):
+        try:
+            known = pd.read_pickle(path)
+        except Exception:
+            known = None
+    if known is None or known["version"] != stamp:
+        known = {"version": stamp, "texts": {}, "outputs": None}
+    changed = [t for t, f in current.items() if known["texts"].get(t) != f]
+    kept = [t for t, f in current.items() if known["texts"].get(t) == f]
+    if known["outputs"] is not None and len(changed) == 0 and len(kept) == len(known["texts"]):
+        return {output: frame for output, (frame, owners) in known["outputs"].items()}
+    if known["outputs"] is None:
+        fresh = build(corpus)
+    elif len(changed) == 0:
+        fresh = {output: frame.iloc[:0] for output, (frame, owners) in known["outputs"].items()}
+    else:
+        fresh = build(corpus[corpus[key].isin(changed)].copy())
+    texts = corpus[key].to_numpy()
+    outputs = {}
+    for output, frame in fresh.items():
+        owners = texts[positions(corpus, frame, name + "/" + output, token)]
+        if known["outputs"] is not None and output in known["outputs"]:
+            old, old_owners = known["outputs"][output]
+            keep = np.isin(old_owners, kept)
+            frame, owners = splice(old[keep], frame, np.concatenate([old_owners[keep], owners]), corpus, name + "/" + output, token)
+        outputs[output] = (frame, owners)
+    try:
+        os.makedirs(cache, exist_ok=True)
+        pd.to_pickle({"version": stamp, "texts": current, "outputs": outputs}, path)
+    except OSError:
+        pass
+    return {output: frame for output, (frame, owners) in outputs.items()}
+    # run build() (which turns a CEIPoM frame into a dictionary of datasets) on
+    # the texts which are new or have changed since the last run only, and
+    # splice its rows into the stored results for the other texts; rows are
+    # tied to texts through their Token_ID column, so every row of a dataset
+    # must come from a single text; the first run (or any change to the code
+    # in depends) builds everything
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+"""
+Output: Regenerates the datasets, regression datasets, figures and tables
+Used in: Maintenance of the whole folder
+"""
+
+
+### 0 ### Imports
+
+# import some standard libraries
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# the parent folder of the supplementary material, where every script is run
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+manifest = os.path.join(root, ".pipeline.json")
+
+
+### 1 ### The scripts, with the files they read and write
+
+# the CEIPoM csv files and the modules reading them
+ceipom = ["initialisation/CEIPoM_import.py"] + ["CEIPoM/{}.csv".format(i) for i in ["links", "texts", "sentences", "tokens", "analysis"]]
+session = ["initialisation/session.py", "initialisation/syntax_query.py"]
+syntax = session + ["initialisation/incremental.py"]
+proiel = ["PROIEL/{}".format(i) for i in ["caes-gal.xml", "cic-att.xml", "cic-off.xml", "latin-nt.xml"]]
+orders = ["datasets_automatic/order_{}.csv".format(i) for i in ["accusative", "dative", "adverbial", "genitive", "adjective"]]
+effects = ["regression_datasets/effect_plot_{}.csv".format(i) for i in ["language", "date", "language_mixed", "date_mixed"]]
+
+# each step is a script, the files it reads (besides itself) and the files it writes
+steps = [
+    ("datasets_scripts/coordination_dataset.py", ceipom + syntax, ["datasets_automatic/coordination_dataset.csv"]),
+    ("datasets_scripts/loanwords_dataset.py", ["datasets_manual/loanwords_italic.csv", "WOLD/forms.csv", "WOLD/languages.csv", "initialisation/syntax_query.py"] + proiel, ["datasets_automatic/loanwords_dataset.csv"]),
+    ("datasets_scripts/locative_dataset.py", ceipom + session, ["datasets_automatic/locative_dataset.csv"]),
+    ("datasets_scripts/phonological_dataset.py", ["datasets_manual/pairs_modern.csv", "datasets_manual/pairs_ancient.csv"], ["datasets_automatic/phonological_dataset.csv"]),
+    ("datasets_scripts/syntax_datasets.py", ceipom + syntax, orders),
+    ("regression_scripts/accusative_order.R", ["datasets_automatic/order_accusative.csv"], effects),
+    ("regression_scripts/loanwords_regression.R", ["datasets_automatic/loanwords_dataset.csv"], ["regression_datasets/effect_plot_loanwords.csv"]),
+    ("figures_scripts/coordination_typology.py", ["datasets_manual/coordination_typology.csv"], ["figures/coordination_typology.pdf"]),
+    ("figures_scripts/inscriptions_space.py", ["datasets_manual/italian_epigraphy.csv"], ["figures/inscriptions_space.png", "figures/inscriptions_space.pdf"]),
+    ("figures_scripts/inscriptions_time.py", ["datasets_manual/italian_epigraphy.csv"], ["figures/inscriptions_time.pdf"]),
+    ("figures_scripts/italian_accusative.py", ["datasets_automatic/order_accusative.csv"], ["figures/italian_accusative.pdf"]),
+    ("figures_scripts/italian_adjective.py", ["datasets_enriched/order_adjective_enriched.csv"], ["figures/italian_adjective.pdf"]),
+    ("figures_scripts/italian_adverbial.py", ["datasets_automatic/order_adverbial.csv"], ["figures/italian_adverbial.pdf"]),
+    ("figures_scripts/italian_dative.py", ["datasets_automatic/order_dative.csv"], ["figures/italian_dative.pdf"]),
+    ("figures_scripts/italian_genitive.py", ["datasets_automatic/order_genitive.csv"], ["figures/italian_genitive.pdf"]),
+    ("figures_scripts/latin_accusative.py", ["datasets_automatic/order_accusative.csv"], ["figures/latin_accusative.pdf"]),
+    ("figures_scripts/loanword_borrowability.py", ["datasets_automatic/loanwords_dataset.csv"], ["figures/loanword_borrowability.pdf"]),
+    ("figures_scripts/loanword_fields.py", ["tables/loanword_fields.csv"], ["figures/loanword_fields.pdf"]),
+    ("figures_scripts/loanword_source.py", ["datasets_automatic/loanwords_dataset.csv"], ["figures/loanword_source.pdf"]),
+    ("figures_scripts/mediterranean_diversity.py", ["datasets_manual/mediterranean_diversity.csv"], ["figures/mediterranean_diversity.pdf"]),
+    ("figures_scripts/object_order_typology.py", ["WALS/values.csv", "WALS/languages.csv"], ["figures/object_order_typology.pdf"]),
+    ("figures_scripts/phonological_distances.py", ["datasets_automatic/phonological_dataset.csv"], ["figures/phonological_distances.pdf"]),
+    ("figures_scripts/sabellic_locative.py", ceipom + session + ["datasets_manual/sabellic_locative.csv"], ["figures/sabellic_locative.png", "figures/sabellic_locative.pdf"]),
+    ("figures_scripts/syntax_regression.py", effects, ["figures/syntax_regression.pdf"]),
+    ("figures_scripts/typology.py", ["datasets_manual/typology.csv", "WALS/values.csv"], ["figures/typology_heatmap.pdf", "figures/typology_dendrogram.pdf", "figures/typology_mds.pdf", "figures/typology_mds_subsets.pdf"]),
+    ("tables_scripts/adjective_summary.py", ["datasets_enriched/order_adjective_enriched.csv"], ["tables/adjective_summary.csv"]),
+    ("tables_scripts/ceipom_summary.py", ceipom, ["tables/ceipom_summary.csv"]),
+    ("tables_scripts/coordination_summary.py", ["datasets_automatic/coordination_dataset.csv"], ["tables/coordination_summary.csv"]),
+    ("tables_scripts/loanword_fields.py", ["datasets_automatic/loanwords_dataset.csv"], ["tables/loanword_fields.csv"]),
+    ("tables_scripts/loanword_non_greek.py", ["datasets_automatic/loanwords_dataset.csv"], ["tables/loanword_non_greek.csv"]),
+    ("tables_scripts/loanword_outliers.py", ["datasets_automatic/loanwords_dataset.csv"], ["tables/loanword_outliers.csv"]),
+    ]
+# order_adjective_enriched.csv is enriched by hand from order_adjective.csv, so
+# it is treated as a source file rather than as the output of a step
+
+# the scripts which take a number of worker processes for their tree queries
+parallel = ["datasets_scripts/coordination_dataset.py", "datasets_scripts/syntax_datasets.py"]
+
+
+### 2 ### Hash the files
+
+def digest(path, known):
+    full = os.path.join(root, path)
+    if not os.path.isfile(full):
+        return None
+    stat = os.stat(full)
+    old = known.get(path, {})
+    if old.get("size") == stat.st_size and old.get("mtime") == stat.st_mtime_ns:
+        return old["sha1"]
+    sha1 = hashlib.sha1()
+    with open(full, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(block)
+    known[path] = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "sha1": sha1.hexdigest()}
+    return known[path]["sha1"]
+    # the hash of a file (None if it doesn't exist); files whose size and mtime
+    # are unchanged since they were last hashed aren't read again
+
+def up_to_date(step, state):
+    script, inputs, outputs = step
+    done = state["steps"].get(script)
+    if done is None:
+        return False
+    current = {path: digest(path, state["files"]) for path in [script] + inputs}
+    written = {path: digest(path, state["files"]) for path in outputs}
+    return done["inputs"] == current and done["outputs"] == written and None not in written.values()
+    # a step is up to date if its script and inputs haven't changed since it was
+    # last run, and its outputs are still there, as it left them
+
+
+### 3 ### Run the steps
+
+def command(script, shards=None):
+    if script.endswith(".R"):
+        return ["Rscript", script]
+    if script in parallel and shards is not None:
+        return [sys.executable, script, "--processes", str(shards)]
+    return [sys.executable, script]
+    # R scripts are run with Rscript, Python scripts with this interpreter (and
+    # the scripts with parallel tree queries with a number of worker processes)
+
+def execute(script, shards=None):
+    env = dict(os.environ, MPLBACKEND="Agg")
+    env["PYTHONPATH"] = os.pathsep.join([os.path.join(root, "initialisation")] + [p for p in [os.environ.get("PYTHONPATH")] if p])
+    start = time.perf_counter()
+    try:
+        result = subprocess.run(command(script, shards), cwd=root, env=env, capture_output=True, text=True)
+        code, error = result.returncode, result.stderr
+    except OSError as e:
+        code, error = 1, str(e)
+    return code, time.perf_counter() - start, error
+    # runs one script from the parent folder (with the initialisation modules
+    # importable and figures drawn off screen), in its own process
+
+def select(targets):
+    if not targets:
+        return list(steps)
+    producer = {path: step for step in steps for path in step[2]}
+    wanted = [step for step in steps if step[0] in targets or any(path in targets for path in step[2])]
+    found = set()
+    while wanted:
+        step = wanted.pop()
+        if step[0] not in found:
+            found.add(step[0])
+            wanted += [producer[path] for path in step[1] if path in producer]
+    return [step for step in steps if step[0] in found]
+    # the steps needed for some scripts or output files, including every step
+    # upstream of them
+
+def run(targets=None, processes=None, force=False):
+    state = {"files": {}, "steps": {}}
+    if os.path.exists(manifest):
+        with open(manifest, encoding="utf-8") as f:
+            state = json.load(f)
+    chosen = select(targets)
+    producer = {path: step[0] for step in chosen for path in step[2]}
+    waiting = {step[0]: step for step in chosen}
+    status = {}
+    running = {}
+    times = {}
+    start = time.perf_counter()
+    workers = processes or os.cpu_count() or 1
+    shards = max(1, (os.cpu_count() or 1) // workers)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while waiting or running:
+            for script, step in list(waiting.items()):
+                before = [producer[path] for path in step[1] if path in producer]
+                if any(status.get(b) in ["failed", "skipped"] for b in before):
+                    status[script] = "skipped"
+                elif any(b not in status for b in before):
+                    continue
+                elif any(digest(path, state["files"]) is None for path in [script] + step[1]):
+                    missing = [path for path in [script] + step[1] if digest(path, state["files"]) is None]
+                    print("{:>9}  {}  (missing {})".format("failed", script, ", ".join(missing)))
+                    status[script] = "failed"
+                elif not force and up_to_date(step, state):
+                    print("{:>9}  {}".format("current", script))
+                    status[script] = "current"
+                else:
+                    running[pool.submit(execute, script, shards)] = step
+                del waiting[script]
+            if not running:
+                continue
+            finished, pending = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                script, inputs, outputs = running.pop(future)
+                code, seconds, error = future.result()
+                times[script] = seconds
+                written = {path: digest(path, state["files"]) for path in outputs}
+                if code == 0 and None not in written.values():
+                    state["steps"][script] = {"inputs": {path: digest(path, state["files"]) for path in [script] + inputs}, "outputs": written}
+                    status[script] = "ran"
+                    print("{:>7.1f} s  {}".format(seconds, script))
+                else:
+                    state["steps"].pop(script, None)
+                    status[script] = "failed"
+                    print("{:>9}  {}  ({:.1f} s)".format("failed", script, seconds))
+                    print("\n".join("           " + line for line in error.strip().splitlines()[-5:]))
+                with open(manifest, "w", encoding="utf-8") as f:
+                    json.dump(state, f, indent=1)
+    counts = {s: list(status.values()).count(s) for s in ["ran", "current", "failed", "skipped"]}
+    print("{ran} run, {current} up to date, {failed} failed, {skipped} skipped".format(**counts))
+    print("{:.1f} s of work in {:.1f} s".format(sum(times.values()), time.perf_counter() - start))
+    return status
+    # runs every chosen step whose script or inputs have changed since it last
+    # ran (or whose outputs have gone), as soon as the steps it depends on are
+    # done, with independent steps running side by side; steps downstream of a
+    # failure are skipped, and the hashes are kept in .pipeline.json; the cores
+    # are split between the steps running at once, so that steps with parallel
+    # tree queries don't each start a worker process for every core
+
+
+### 4 ### Run from the command line
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Regenerate the outputs which are out of date.")
+    parser.add_argument("targets", nargs="*", help="scripts or output files to bring up to date (all by default)")
+    parser.add_argument("--processes", type=int, default=None, help="number of scripts to run at once")
+    parser.add_argument("--force", action="store_true", help="rerun the chosen steps even if they are up to date")
+    arguments = parser.parse_args()
+    status = run(arguments.targets, arguments.processes, arguments.force)
+    sys.exit(1 if "failed" in status.values() else 0)
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+"""
+Output: Runs the scripts using CEIPoM against a single loaded corpus
+Used in: datasets_scripts, figures_scripts, tables_scripts
+"""
+
+
+### 0 ### necessary imports
+
+# import some standard libraries
+import argparse
+import functools
+import importlib.util
+import inspect
+import os
+import time
+
+# import the CEIPoM database and the tree search
+import CEIPoM_import
+from syntax_query import TreeSearch, process_pool
+
+# the scripts which use CEIPoM, each with a main(session) entry point
+scripts = ["datasets_scripts/coordination_dataset.py",
+           "datasets_scripts/locative_dataset.py",
+           "datasets_scripts/syntax_datasets.py",
+           "figures_scripts/sabellic_locative.py",
+           "tables_scripts/ceipom_summary.py"]
+
+
+### 1 ### a corpus loaded and indexed once
+
+class Session:
+
+    def __init__(self, database=None):
+        self.database = CEIPoM_import.database if database is None else database
+        # a session over the whole of CEIPoM, shared with any module importing
+        # CEIPoM from CEIPoM_import (or over another database object, e.g. from
+        # load_ceipom with some languages or dates only)
+
+    @functools.cached_property
+    def corpus(self):
+        return self.database.CEIPoM
+        # the merged CEIPoM dataframe, loaded the first time it is needed
+
+    @functools.cached_property
+    def texts(self):
+        return self.database.texts
+        # the CEIPoM texts table
+
+    @functools.cached_property
+    def search(self):
+        return TreeSearch(self.corpus)
+        # the TreeSearch object over the corpus, indexed the first time it is
+        # needed; it works on its own (shallow) copy of the corpus, so the
+        # corpus every script sees is the same whichever scripts ran before
+
+    def run(self, paths=scripts, processes=1):
+        global running
+        paths = list(paths)
+        running = self
+        try:
+            pool = process_pool(processes) if len(paths) > 1 else None
+            if pool is None:
+                return [run_script(path, self) for path in paths]
+            self.search
+            shards = max(1, (os.cpu_count() or 1) // processes)
+            with pool:
+                return list(pool.map(run_script, paths, [None] * len(paths), [shards] * len(paths)))
+        finally:
+            running = None
+        # runs the main() of each script against this session, one after the
+        # other or in forked worker processes which share the loaded corpus and
+        # its indexes (copy-on-write) rather than reloading them; scripts running
+        # side by side split the cores between their own worker processes, so
+        # that there are never many more processes than cores; returns the wall
+        # time of each script
+
+
+### 2 ### load and run the scripts
+
+running = None
+#the session of the current Session.run call; forked workers inherit it
+
+def entry_point(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.main
+    # imports a script as a module (which runs nothing but its definitions) and
+    # returns its main() function
+
+def run_script(path, session=None, processes=None):
+    session = running if session is None else session
+    main = entry_point(path)
+    start = time.perf_counter()
+    if "processes" in inspect.signature(main).parameters:
+        main(session, processes=processes)
+    else:
+        main(session)
+    seconds = time.perf_counter() - start
+    print("{:>7.1f} s  {}".format(seconds, path))
+    return seconds
+    # runs one script against a session (with the given number of worker
+    # processes, for scripts whose main() takes one) and reports how long it took
+
+
+### 3 ### run from the command line
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the scripts using CEIPoM against a single loaded corpus.")
+    parser.add_argument("paths", nargs="*", default=scripts, help="scripts to run (all scripts using CEIPoM by default)")
+    parser.add_argument("--processes", type=int, default=1, help="number of scripts to run at once, in forked workers")
+    arguments = parser.parse_args()
+    start = time.perf_counter()
+    session = Session()
+    session.search
+    print("{:>7.1f} s  loading and indexing CEIPoM".format(time.perf_counter() - start))
+    session.run(arguments.paths, arguments.processes)
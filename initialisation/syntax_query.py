@@ -12,13 +12,21 @@ Date: 10/04/2023
 
 import pandas as pd
 import numpy as np
+import io
+import os
 import re
+import warnings
+import xml.etree.ElementTree as ET
+import multiprocessing as mp
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 
 def collapse(l):
     return(list(dict.fromkeys([i for j in l for i in j])))
     #collapses lists of lists and removes any resulting duplicates
 
-def adapt_csv(df):
+def adapt_columns(df):
+    df = df.copy(deep=False)
     df.columns = df.columns.str.replace(r"word id", "Token_ID")
     df.columns = df.columns.str.replace(r"sentence id", "Sentence_ID")
     df.columns = df.columns.str.replace(r"relation", "Relation")
@@ -29,36 +37,92 @@ def adapt_csv(df):
     df['Sentence_ID'] = df['Sentence_ID'].replace('', np.nan).fillna(0).astype(int)
     df['Token_ID'] = df['Token_ID'].replace('', np.nan).fillna(0).astype(int)
     df['Head'] = df['Head'].replace('', np.nan).fillna(0).astype(int)
-    df = df.fillna("")
     return df
-    #adds some resilience to csvs with slightly different titles
+    #adds some resilience to csvs with slightly different titles, and makes
+    # the ids and heads integers (0 where missing); works on a shallow copy, so
+    # the frame passed in is left as it is
+
+def adapt_csv(df):
+    df = adapt_columns(df)
+    df = df.fillna({i: "" for i in df.columns if not typed_column(df[i].dtype)})
+    return df
+    #ditto, with missing strings filled in with "" for TreeSearch
+
+def typed_column(dtype):
+    nullable = pd.api.types.is_extension_array_dtype(dtype) and dtype.kind in "iufb"
+    return nullable or isinstance(dtype, pd.CategoricalDtype)
+    #nullable numeric and categorical columns (as in the typed CEIPoM frame)
+    # keep their missing values rather than being filled with ""
     
-def xml_to_df(xml):    
-    xml = xml.split('\n')
-    xml = [i.strip() for i in xml]
-    queries = ["sentence id='.*?'","word id='.*?'","head='.*?'","relation='.*?'","lemma='.*?'","form='.*?'","postag='.*?'"]
-    sid = False
-    data = []
-    for line in xml:
-        record = []
-        for i, query in enumerate(queries):
-            results = re.findall(query,line)
-            try:
-                new = results[0]
-                new = new[len(query)-4:-1]
-                if query == "sentence id='.*?'":
-                    sid = new
-            except IndexError:
-                if query == "sentence id='.*?'":
-                    new = sid
-                else:
-                    new = ""
-            record.append(new)
-        data.append(record)
-    data = pd.DataFrame(data,columns=["Sentence_ID","Token_ID","Head","Relation","Lemma","Token","POS"])
-    data = data[data["Token_ID"] != ""]
+TREEBANK_FIELDS = {
+    "word": {"id": "Token_ID", "head": "Head", "relation": "Relation", "lemma": "Lemma", "form": "Token", "postag": "POS"},
+    "token": {"id": "Token_ID", "head-id": "Head", "relation": "Relation", "lemma": "Lemma", "form": "Token", "part-of-speech": "POS"}}
+    #attributes read from AGDT (<word>) and PROIEL (<token>) elements
+
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+    #turns an xml attribute into an integer, 0 if it is missing or malformed
+
+def open_treebank(source):
+    if hasattr(source, "read"):
+        return source, False
+    if isinstance(source, str) and source.lstrip().startswith("<"):
+        return io.StringIO(source), False
+    return open(source, "rb"), True
+    #accepts a file path, an open file object or a string of xml
+
+def read_treebank(source):
+    f, close = open_treebank(source)
+    try:
+        stack = []
+        sid = 0
+        records = []
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            tag = elem.tag.rsplit("}", 1)[-1]
+            if event == "start":
+                stack.append(elem)
+                if tag == "sentence":
+                    sid = to_int(elem.get("id"))
+                    records = []
+                continue
+            stack.pop()
+            if tag in TREEBANK_FIELDS:
+                fields = TREEBANK_FIELDS[tag]
+                record = {"Sentence_ID": sid, "Relation": "", "Lemma": "", "Token": "", "POS": "", "Head": 0}
+                for attribute, column in fields.items():
+                    if attribute in elem.attrib:
+                        record[column] = elem.attrib[attribute]
+                record["Token_ID"] = to_int(record.get("Token_ID"))
+                record["Head"] = to_int(record["Head"])
+                records.append(record)
+            elif tag == "sentence":
+                yield sid, records
+                records = []
+                elem.clear()
+                if len(stack) > 0:
+                    stack[-1].remove(elem)
+    finally:
+        if close:
+            f.close()
+    #streams an AGDT- or PROIEL-style treebank, yielding (sentence_id, token
+    # records) one sentence at a time; finished sentences are dropped from the
+    # parse tree, so memory use doesn't grow with the size of the file
+
+def xml_to_df(xml):
+    columns = {"Sentence_ID": array("q"), "Token_ID": array("q"), "Head": array("q"),
+               "Relation": [], "Lemma": [], "Token": [], "POS": []}
+    for sid, records in read_treebank(xml):
+        for record in records:
+            for column, values in columns.items():
+                values.append(record[column])
+    data = pd.DataFrame({column: np.frombuffer(values, dtype=np.int64) if isinstance(values, array) else values
+                         for column, values in columns.items()})
     return data
-    #turns AGDT-style xmls into dataframes
+    #turns AGDT- or PROIEL-style xmls (a path, file object or string) into
+    # dataframes with integer id columns
 
 def unique_token_ids(df):
     n = 100
@@ -71,43 +135,625 @@ def unique_token_ids(df):
     df['Token_ID'] = df['Token_ID'].astype(int)
     return df
     #modifies dataframes where token_id count starts from 1 in each sentence
+
+def treebank_frame(path):
+    df = xml_to_df(path)
+    if df["Token_ID"].duplicated().any():
+        df = unique_token_ids(df)
+    return df
+    #reads a single treebank file into a dataframe with unique token_ids (used
+    # by TreeSearch.from_files, and defined here so worker processes can find it)
+
+def process_pool(processes):
+    if processes == 1 or "fork" not in mp.get_all_start_methods():
+        return None
+    return ProcessPoolExecutor(max_workers=processes, mp_context=mp.get_context("fork"))
+    #returns a pool of forked worker processes, or None where forking isn't
+    # available (e.g. on Windows, where scripts would otherwise be re-imported
+    # by every worker) so that callers fall back on working serially
+
+sharded = None
+#the TreeSearch object, function and grouping of the current map_shards call;
+# forked workers inherit it, so the corpus is never pickled to reach them
+
+def run_shard(task):
+    groups, ids = task
+    search, function, by = sharded
+    shard = search.shard(np.flatnonzero(np.isin(search.store().codes_of(by), groups)))
+    return list(function(shard, ids))
+    #runs the function of the current map_shards call over one shard (used by
+    # TreeSearch.map_shards, and defined here so worker processes can find it)
+
+def integer(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError, OverflowError):
+        return np.nan
+    #turns a value into an integer the way int() does, or NaN where int() fails
+
+def native(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+    #turns numpy scalars into the python objects pandas' .item() would return
+
+def parse_conditions(text):
+    output = []
+    for part in text.split("&"):
+        if part.strip() == "":
+            continue
+        match = re.fullmatch(r"\s*([^!=~]+?)\s*(!=|!~|=|~)\s*(.*?)\s*", part)
+        if match is None:
+            raise ValueError("can't read the condition {!r}".format(part.strip()))
+        output.append(match.groups())
+    return output
+    #turns "Relation~OBJ & Part_of_speech!=verb" into (column, operator, value)
+    # triples: = and != compare values, ~ and !~ search with a regex
+
+def parse_pattern(text):
+    nodes = {}
+    relations = []
+    for line in re.split(r"[;\n]", text):
+        line = line.strip()
+        if line == "":
+            continue
+        if ":" in line:
+            name, conditions = line.split(":", 1)
+            nodes[name.strip()] = conditions
+        else:
+            words = line.split()
+            if len(words) != 3:
+                raise ValueError("can't read the relation {!r}".format(line))
+            relations.append(tuple(words))
+    return nodes, relations
+    #reads a pattern such as "x: Relation~OBJ; v: Part_of_speech=verb; x
+    # smart_parent v" into its nodes (variable: conditions) and its relations
+    # (variable relation variable), one per line or separated by semicolons
+
+def compare(values, operator, value):
+    values = pd.Series(values)
+    if operator in ["=", "!="]:
+        if pd.api.types.is_numeric_dtype(values):
+            try:
+                output = (values == float(value)).to_numpy()
+            except ValueError:
+                output = np.zeros(len(values), dtype=bool)
+        else:
+            output = (values.astype(str) == value).to_numpy()
+    else:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)
+            output = values.astype(str).str.contains(value, regex=True).to_numpy(dtype=bool)
+    return ~output if operator[0] == "!" else output
+    #evaluates one condition over an array of values (a column, or the
+    # distinct values of an encoded column)
+
+def conforms(values, types):
+    codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=False)
+    flags = np.array([isinstance(v, types) for v in uniques] + [False], dtype=bool)
+    return flags[codes]
+    #checks, for every value of a column, whether it is an instance of the given
+    # type(s), testing each distinct value only once
+
+def remember(cache, key, function, limit=10000):
+    try:
+        hash(key)
+    except TypeError:
+        return function()
+    if key in cache:
+        return cache[key]
+    if len(cache) >= limit:
+        del cache[next(iter(cache))]
+    cache[key] = function()
+    return cache[key]
+    #returns a cached result, computing and storing it if needed; the oldest
+    # entry is dropped once the cache holds "limit" results
     
     
-### 1 ### Define the syntaxsearch object
+### 1 ### Define a compact token store
+
+class TokenStore:
+    
+    ### 0 ### CONVERT A DATAFRAME INTO ARRAYS
+    def __init__(self, df):
+        self.df = df
+        self.size = len(df)
+        self.index = df.index
+        self.columns = df.columns
+        self.ids = df.index.to_numpy()
+        self.row_of = None
+        if self.size > 0 and self.ids.dtype.kind in "iu":
+            low, high = int(self.ids.min()), int(self.ids.max())
+            if low >= 0 and high <= 8 * self.size + 1000000:
+                self.row_of = np.full(high + 1, -1, dtype=np.int32)
+                self.row_of[self.ids] = np.arange(self.size, dtype=np.int32)
+        #dense token_id -> row mapping (falls back on the pandas index for ids
+        # which are not small non-negative integers)
+        
+        heads = pd.to_numeric(df["Head"], errors="coerce") if "Head" in df.columns else pd.Series(0, index=df.index)
+        self.heads = heads.fillna(0).to_numpy().astype(np.int64)
+        self.head_row = self.rows(self.heads)
+        #head token_ids (0 where missing) and the rows they point at (-1 where
+        # the head is the root or lies outside the corpus)
+        
+        attached = self.head_row >= 0
+        order = np.argsort(self.head_row, kind="stable")
+        self.child_rows = order[attached[order]].astype(np.int32)
+        counts = np.bincount(self.head_row[attached], minlength=self.size)
+        self.child_offsets = np.zeros(self.size + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.child_offsets[1:])
+        self.loose_children = {}
+        for h, r in zip(self.heads[~attached].tolist(), np.flatnonzero(~attached).tolist()):
+            self.loose_children.setdefault(h, []).append(r)
+        #CSR-style children index: the children of row r are
+        # child_rows[child_offsets[r]:child_offsets[r+1]], in corpus order;
+        # children of heads outside the corpus (including the root 0) are kept
+        # in a dictionary keyed by head token_id
+        
+        if "Sentence_ID" in df.columns:
+            codes, uniques = pd.factorize(df["Sentence_ID"])
+        else:
+            codes, uniques = np.zeros(self.size, dtype=np.int64), np.array([0])
+        self.sentence_of = codes.astype(np.int32)
+        self.sentence_index = pd.Index(uniques)
+        self.sentence_order = np.argsort(self.sentence_of, kind="stable").astype(np.int32)
+        self.sentence_offsets = np.zeros(len(uniques) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.sentence_of, minlength=len(uniques)), out=self.sentence_offsets[1:])
+        #sentence index: each row's sentence number, and for each sentence a
+        # contiguous slice of sentence_order holding its rows in corpus order
+        
+        self.smart_children_maps = {}
+        self.coord_relations = {}
+        self.coordinations = {}
+        #caches filled by TreeSearch as queries come in (per sentence for smart
+        # children, per token for coordination)
+        
+        self.codes = {}
+        self.categories = {}
+        self.arrays = {}
+        for column in ["Relation", "POS", "Lemma", "Token"]:
+            if column in df.columns:
+                self.encode(column)
+        #categorical codes for the columns most queries touch; any other column
+        # is turned into an array the first time it is asked for
+        
+        relations = self.categories.get("Relation", np.array([], dtype=object))
+        codes = self.codes.get("Relation", np.full(self.size, -1, dtype=np.int32))
+        def flag(test):
+            flags = np.array([isinstance(r, str) and test(r) for r in relations] + [False], dtype=bool)
+            return flags[codes]
+        self.aux = flag(lambda r: "Aux" in r)
+        self.coord = flag(lambda r: r == "COORD")
+        self.co = flag(lambda r: "_CO" in r)
+        self.coordinator = flag(lambda r: "COORD" in r)
+        self.coord_codes = None
+        self.child_relation_keys = None
+        self.inverted = {}
+        self.depth = None
+        #per-row flags for the relation substrings the coordination logic and
+        # validate() rely on; coord_codes is filled in by coordinated_relations(), the
+        # inverted indexes per column by postings(), and depth and the other
+        # tree arrays by euler_tour()
+
+    def encode(self, column):
+        codes, uniques = pd.factorize(self.df[column], use_na_sentinel=False)
+        self.codes[column] = codes.astype(np.int32)
+        self.categories[column] = np.asarray(uniques, dtype=object)
+        #stores a column as int32 codes plus an array of its distinct values
+
+    def column(self, column):
+        if column not in self.arrays:
+            data = self.df[column]
+            if typed_column(data.dtype):
+                self.arrays[column] = data.to_numpy(dtype=object, na_value="")
+            else:
+                self.arrays[column] = data.to_numpy()
+        return self.arrays[column]
+        #returns (and remembers) a column as a numpy array; nullable and
+        # categorical columns give plain values, with "" where one is missing
+
+
+    ### 1 ### LOOKUPS
+    def row(self, i):
+        if isinstance(i, (bool, np.bool_)):
+            return -1
+        if isinstance(i, float) and i.is_integer():
+            i = int(i)
+        if self.row_of is not None:
+            if isinstance(i, (int, np.integer)) and 0 <= i < len(self.row_of):
+                return int(self.row_of[i])
+            return -1
+        try:
+            r = self.index.get_loc(i)
+        except Exception:
+            return -1
+        return r if isinstance(r, int) else -1
+        #returns the row of a token_id, or -1 if it isn't in the corpus
+
+    def rows(self, ids):
+        ids = np.asarray(ids)
+        if ids.size == 0:
+            return np.zeros(0, dtype=np.int32)
+        if self.row_of is not None and ids.dtype.kind in "iu":
+            output = np.full(len(ids), -1, dtype=np.int32)
+            valid = (ids >= 0) & (ids < len(self.row_of))
+            output[valid] = self.row_of[ids[valid]]
+            return output
+        return self.index.get_indexer(ids).astype(np.int32)
+        #vectorised version of the above
+
+    def value(self, column, i):
+        r = self.row(i)
+        if r < 0:
+            return ""
+        if column in self.codes:
+            return native(self.categories[column][self.codes[column][r]])
+        try:
+            return native(self.column(column)[r])
+        except KeyError:
+            return ""
+        #returns a single value, or an empty string if either the token or the
+        # column is missing (mirroring the DataFrame-based lookups)
+
+    def values(self, column, ids):
+        rows = self.rows(ids)
+        found = rows >= 0
+        if column in self.codes:
+            data = self.categories[column][self.codes[column][rows[found]]]
+        elif column in self.df.columns:
+            data = self.column(column)[rows[found]]
+        else:
+            return np.full(len(rows), "", dtype=object)
+        if found.all():
+            return data
+        output = np.full(len(rows), "", dtype=object)
+        output[found] = data
+        return output
+        #vectorised version of the above: one gather for a whole array of ids
+
+    def parent(self, i):
+        r = self.row(i)
+        if r < 0:
+            return 0
+        return int(self.heads[r])
+        #returns the head of a token_id as an integer, 0 if it is missing
+
+    def parents(self, ids):
+        rows = self.rows(ids)
+        output = np.zeros(len(rows), dtype=np.int64)
+        output[rows >= 0] = self.heads[rows[rows >= 0]]
+        return output
+        #vectorised version of the above
+
+    def children_rows(self, r):
+        return self.child_rows[self.child_offsets[r]:self.child_offsets[r + 1]]
+        #returns the rows of the direct children of a row
+
+    def children(self, i):
+        r = self.row(i)
+        if r >= 0:
+            return self.ids[self.children_rows(r)].tolist()
+        try:
+            return self.ids[self.loose_children.get(i, [])].tolist()
+        except TypeError:
+            return []
+        #returns the token_ids of the direct children of a token_id
+
+    def codes_of(self, column):
+        if column == "Sentence_ID":
+            return self.sentence_of
+        return pd.factorize(self.df[column])[0]
+        #returns a group number per row for the values of a column (the sentence
+        # numbers for Sentence_ID)
+
+    def sentence_number(self, s):
+        try:
+            n = self.sentence_index.get_loc(s)
+        except Exception:
+            return -1
+        return n if isinstance(n, int) else -1
+        #returns the position of a Sentence_ID in the sentence index, or -1
+
+    def sentence_rows(self, n):
+        if n < 0:
+            return self.sentence_order[:0]
+        return self.sentence_order[self.sentence_offsets[n]:self.sentence_offsets[n + 1]]
+        #returns the rows of a sentence (given by its position in the index)
+
+    def inverted_index(self, column):
+        if column not in self.inverted:
+            if column in self.codes:
+                codes, categories = self.codes[column], self.categories[column]
+            else:
+                codes, categories = pd.factorize(self.df[column], use_na_sentinel=False)
+                categories = np.asarray(categories, dtype=object)
+            order = np.argsort(codes, kind="stable").astype(np.int32)
+            offsets = np.zeros(len(categories) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(codes, minlength=len(categories)), out=offsets[1:])
+            lookup = {}
+            for k, v in enumerate(categories.tolist()):
+                if not (isinstance(v, float) and v != v):
+                    lookup.setdefault(v, k)
+            self.inverted[column] = (order, offsets, lookup, categories)
+        return self.inverted[column]
+        #value -> rows index for a column, built the first time the column is
+        # searched: the rows of value number k are order[offsets[k]:offsets[k+1]],
+        # in corpus order (NaN is left out, as it never equals anything)
+
+    def postings(self, column, value):
+        order, offsets, lookup, categories = self.inverted_index(column)
+        k = lookup.get(value)
+        if k is None:
+            return np.zeros(0, dtype=np.int32)
+        return order[offsets[k]:offsets[k + 1]]
+        #returns the rows holding a value in a column
+
+    def regex_postings(self, column, pattern):
+        order, offsets, lookup, categories = self.inverted_index(column)
+        hits = pd.Series(categories, dtype=object).str.contains(pattern, regex=True)
+        if hits.isna().any():
+            return None
+        hits = np.flatnonzero(hits.to_numpy(dtype=bool))
+        if len(hits) == 0:
+            return np.zeros(0, dtype=np.int32)
+        return np.sort(np.concatenate([order[offsets[k]:offsets[k + 1]] for k in hits]))
+        #returns the rows whose value matches a regex, running it once per
+        # distinct value and merging their rows; None if some values aren't
+        # strings (which the dataframe-based search doesn't accept either)
+
+    def relation_code(self, r):
+        if "Relation" not in self.codes:
+            return -1
+        found = np.flatnonzero(self.categories["Relation"] == r)
+        return int(found[0]) if len(found) > 0 else -1
+        #returns the code of a relation string, or -1 if no token has it
+
+
+    ### 2 ### WHOLE-CORPUS COMPUTATIONS
+    def first_per_parent(self, parents, children):
+        output = np.full(self.size, -1, dtype=np.int64)
+        order = np.lexsort((children, parents))
+        parents, children = parents[order], children[order]
+        unique, first = np.unique(parents, return_index=True)
+        output[unique] = children[first]
+        return output
+        #given parent/child row pairs, returns for every row the first (lowest)
+        # child row paired with it, or -1
+
+    def coordinated_relations(self):
+        if self.coord_codes is None:
+            parent = self.head_row
+            attached = parent >= 0
+            rows = np.arange(self.size)
+            direct = attached & ~self.aux & self.co
+            first = self.first_per_parent(parent[direct], rows[direct])
+            through = attached & self.co
+            through[through] = self.aux[parent[through]] & (self.head_row[parent[through]] >= 0)
+            grandchild = self.first_per_parent(parent[through], rows[through])
+            aux_children = np.flatnonzero(grandchild >= 0)
+            via_aux = self.first_per_parent(parent[aux_children], aux_children)
+            found = np.where(first >= 0, first, np.where(via_aux >= 0, grandchild[np.maximum(via_aux, 0)], -1))
+            codes = self.codes.get("Relation", np.zeros(self.size, dtype=np.int32))
+            self.coord_codes = np.where(found >= 0, codes[np.maximum(found, 0)], -1)
+        return self.coord_codes
+        #vectorised check_coord for the whole corpus: for every row, the
+        # Relation code of the first _CO token among its direct children
+        # (skipping Aux children but looking through them), or -1 for ""
+
+    def has_child_relation(self, rows, codes):
+        if self.child_relation_keys is None:
+            width = len(self.categories.get("Relation", [])) + 1
+            child = self.child_rows
+            parent = self.head_row[child].astype(np.int64)
+            relation = self.codes.get("Relation", np.zeros(self.size, dtype=np.int32))[child]
+            self.child_relation_keys = np.unique(parent * width + relation)
+        width = len(self.categories.get("Relation", [])) + 1
+        keys = np.asarray(rows, dtype=np.int64) * width + np.asarray(codes, dtype=np.int64)
+        return (np.asarray(codes) >= 0) & np.isin(keys, self.child_relation_keys)
+        #checks, for row/relation-code pairs, whether the row has a direct child
+        # with that relation
+
+    def euler_tour(self):
+        if self.depth is None:
+            depth = np.full(self.size, -1, dtype=np.int32)
+            top = np.full(self.size, -1, dtype=np.int32)
+            level = np.flatnonzero(self.head_row < 0).astype(np.int32)
+            levels = []
+            while len(level) > 0:
+                depth[level] = len(levels)
+                top[level] = level if len(levels) == 0 else top[self.head_row[level]]
+                starts = self.child_offsets[level]
+                counts = self.child_offsets[level + 1] - starts
+                first = np.cumsum(counts) - counts
+                levels.append((level, counts, first))
+                level = self.child_rows[np.repeat(starts - first, counts) + np.arange(counts.sum())]
+            size = np.ones(self.size, dtype=np.int64)
+            for level, counts, first in reversed(levels[1:]):
+                np.add.at(size, self.head_row[level], size[level])
+            entry = np.full(self.size, -1, dtype=np.int64)
+            if len(levels) > 0:
+                roots = levels[0][0]
+                entry[roots] = np.cumsum(size[roots]) - size[roots]
+            for (level, counts, first), (children, _, _) in zip(levels, levels[1:]):
+                before = np.cumsum(size[children]) - size[children]
+                before -= np.repeat(np.append(before, 0)[first], counts)
+                entry[children] = entry[self.head_row[children]] + 1 + before
+            reached = np.flatnonzero(depth >= 0)
+            self.preorder = np.zeros(len(reached), dtype=np.int32)
+            self.preorder[entry[reached]] = reached
+            self.depth, self.top, self.entry = depth, top, entry
+            self.exit = entry + size - 1
+        #depth-first numbering of every tree in the corpus, built level by level
+        # from the rows without an in-corpus head: depth counts the steps up to
+        # such a row (top), and the rows below row r are exactly
+        # preorder[entry[r]+1:exit[r]+1]; rows caught in (or hanging from) a
+        # loop are never reached and keep depth -1
+
+    def ancestors(self, r):
+        l = []
+        for k in range(self.depth[r]):
+            r = self.head_row[r]
+            l.append(int(self.ids[r]))
+        l.append(int(self.heads[r]))
+        if l[-1] != 0:
+            l.append(0)
+        return l
+        #returns the token_ids above a reached row, up to and including 0 (a head
+        # outside the corpus is followed by 0, as direct_tree_parent has it)
+
+    def descendants(self, r):
+        rows = self.preorder[self.entry[r] + 1:self.exit[r] + 1]
+        return rows[np.argsort(self.depth[rows], kind="stable")]
+        #returns the rows below a reached row, generation by generation
+
+
+### 2 ### Define the syntaxsearch object
 
 class TreeSearch:
     
     ### 0 ### INITIALISE A DATAFRAME
-    def __init__(self, data):
+    def __init__(self, data, compact=True):
         if isinstance(data, pd.DataFrame):
             self.df = adapt_csv(data)
-        if isinstance(data, str):
+        if isinstance(data, (str, os.PathLike)) or hasattr(data, "read"):
             self.df = xml_to_df(data)
         if len(list(dict.fromkeys(list(self.df["Token_ID"])))) < len(list(self.df["Token_ID"])):
             self.df = unique_token_ids(self.df)
         self.df = self.df.set_index(["Token_ID"])
         self.df.index.name = None
         self.df["Token_ID"] = self.df.index
-        #creates a dataframe object
+        self.compact = compact
+        self.compact_store = TokenStore(self.df) if compact else None
+        #creates a dataframe object from a dataframe or from an xml treebank (a
+        # string, a file path or a file object); with compact=True (the default) single-token
+        # lookups are served from a TokenStore of numpy arrays instead of the
+        # dataframe
+
+    @classmethod
+    def from_files(cls, paths, processes=None, compact=True):
+        paths = list(paths)
+        pool = process_pool(processes) if len(paths) > 1 else None
+        if pool is None:
+            frames = [treebank_frame(path) for path in paths]
+        else:
+            with pool:
+                frames = list(pool.map(treebank_frame, paths))
+        tokens = 0
+        sentences = 0
+        for path, df in zip(paths, frames):
+            if len(df) == 0:
+                continue
+            shift = tokens + 1 - int(df["Token_ID"].min())
+            df["Token_ID"] = df["Token_ID"] + shift
+            df["Head"] = df["Head"].where(df["Head"] == 0, df["Head"] + shift)
+            df["Sentence_ID"] = df["Sentence_ID"] + sentences + 1 - int(df["Sentence_ID"].min())
+            df["Source"] = os.path.basename(str(path))
+            tokens = int(df["Token_ID"].max())
+            sentences = int(df["Sentence_ID"].max())
+        return cls(pd.concat(frames, ignore_index=True), compact=compact)
+        #parses several treebank files (in parallel where possible) and merges
+        # them into one searchable object; token_ids and sentence_ids are made
+        # unique across files by shifting each file past the previous one, and a
+        # Source column records which file every token came from
+
+    def shard(self, rows):
+        part = object.__new__(type(self))
+        part.df = self.df.iloc[rows]
+        part.compact = self.compact
+        part.compact_store = TokenStore(part.df) if self.compact else None
+        return part
+        #returns an independent search object over some rows of this one (whole
+        # sentences or texts, so that trees aren't cut up)
+
+    def map_shards(self, function, ids, processes=None, by="Sentence_ID"):
+        global sharded
+        ids = list(ids)
+        processes = processes or os.cpu_count() or 1
+        sharded = (self, function, by)
+        try:
+            pool = process_pool(processes) if len(ids) > 1 else None
+            if pool is None:
+                return list(function(self, ids))
+            store = self.store()
+            groups = np.full(len(ids), -1, dtype=np.int64)
+            rows = store.rows(ids)
+            groups[rows >= 0] = store.codes_of(by)[rows[rows >= 0]]
+            order = np.argsort(groups, kind="stable")
+            bounds = np.searchsorted(groups[order], groups[order][np.linspace(0, len(ids), processes + 1).astype(int)[1:-1]])
+            chunks = [c for c in np.split(order, bounds) if len(c) > 0]
+            tasks = [(np.unique(groups[c]), [ids[k] for k in c]) for c in chunks]
+            with pool:
+                results = list(pool.map(run_shard, tasks))
+        finally:
+            sharded = None
+        output = [None] * len(ids)
+        for c, result in zip(chunks, results):
+            for k, value in zip(c.tolist(), result):
+                output[k] = value
+        return output
+        #runs function(search, ids) over shards of the corpus in parallel worker
+        # processes and returns its results as one list in the order of ids; ids
+        # are split into one shard per process along whole sentences (or texts,
+        # with by="Text_ID"), so the function must only look within the sentences
+        # of the tokens it is given, and must return one result per token
+
+    def store(self):
+        store = self.compact_store
+        if store is None or store.df is not self.df or store.index is not self.df.index or store.columns is not self.df.columns:
+            self.compact_store = TokenStore(self.df)
+        return self.compact_store
+        #returns the TokenStore, rebuilding it if self.df has been replaced or
+        # has gained or lost rows or columns; values edited in place (e.g. with
+        # search.df.loc[...] = ...) can't be seen cheaply, so call invalidate()
+        # after such edits
+
+    def invalidate(self):
+        self.compact_store = None
+        #drops the TokenStore, with its indexes and the coordination and smart
+        # children results remembered in it, so that the next query rebuilds
+        # them from self.df
+
+    def lookup(self, column, i):
+        if self.compact:
+            return self.store().value(column, i)
+        try:
+            return self.df.loc[[i]][column].item()
+        except:
+            return ""
+        #returns a single value for a single token, or an empty string
+        
+    def sentence_frame(self, s):
+        if self.compact:
+            store = self.store()
+            return self.df.iloc[store.sentence_rows(store.sentence_number(s))]
+        return self.df[self.df["Sentence_ID"] == s]
+        #returns the rows of the dataframe belonging to sentence s
+
+    def sentence_tokens(self, s):
+        if self.compact:
+            store = self.store()
+            return store.ids[store.sentence_rows(store.sentence_number(s))].tolist()
+        return list(self.df[self.df["Sentence_ID"] == s].index)
+        #returns all token_ids in sentence s
         
     def show(self,s="x"):
         if s == "x":
             print(self.df)
         else:
-            print(self.df[self.df["Sentence_ID"] == s])
+            print(self.sentence_frame(s))
         #show the whole dataframe, or a chosen sentence
         
     def export(self,s="x"):
         if s == "x":
             return self.df
         else:
-            return self.df[self.df["Sentence_ID"] == s]
+            return self.sentence_frame(s)
         #export the dataframe object, or a chosen sentence
                 
              
     ### 1 ### GENERAL FUNCTIONS
     def form(self, f):
-        return list(self.df[self.df["Token"] == f].index)
+        return self.subset("Token", f)
         #returns a list of token_ids for a form
         
     def relation(self, i):
@@ -116,42 +762,24 @@ class TreeSearch:
                 i = i[0]
             except:
                 return ""
-        try:
-            return self.df.loc[[i]]["Relation"].item()
-        except:
-            return ""
+        return self.lookup("Relation", i)
         #returns the relation of the current token
         #tries to return the relation of the first token of lists (can be convenient)
 
     def pos(self, i):
-        try:
-            return self.df.loc[[i]]["POS"].item()
-        except:
-            return ""    
+        return self.lookup("POS", i)
         #returns a POS-tag
         
     def lemma(self, i):
-        try:
-            return self.df.loc[[i]]["Lemma"].item()
-        except:
-            return ""    
+        return self.lookup("Lemma", i)
         #returns a Lemma
         
     def token(self, i):    
-        try:
-            return self.df.loc[[i]]["Token"].item()
-        except:
-            return ""
+        return self.lookup("Token", i)
         #returns a token
     
     def tokens(self, l):    
-        output = []
-        for i in l:
-            try:
-                output.append(self.df.loc[[i]]["Token"].item())
-            except:
-                output.append("")
-        return output
+        return [self.lookup("Token", i) for i in l]
         #returns a list of tokens
         
     def show_ids(self, l):
@@ -159,10 +787,22 @@ class TreeSearch:
         #shows subset of dataframe
         
     def sentence_id(self, i):
+        if self.compact:
+            store = self.store()
+            r = store.row(i)
+            if r < 0:
+                raise KeyError(i)
+            return int(store.column("Sentence_ID")[r])
         return int(self.df.loc[[i]]["Sentence_ID"])
         #returns the sentence_id of the current token
 
     def sentence(self, i):
+        if self.compact:
+            store = self.store()
+            r = store.row(i)
+            if r < 0:
+                raise KeyError(i)
+            return store.ids[store.sentence_rows(store.sentence_of[r])].tolist()
         return list(self.df[self.df["Sentence_ID"] == self.sentence_id(i)].index)
         #returns all token_ids in the same sentence as the current token
     
@@ -171,29 +811,119 @@ class TreeSearch:
         #filters all tokens from a list l with relation r
 
     def treetop(self, i):
+        if self.compact:
+            store = self.store()
+            r = store.row(i)
+            if r < 0:
+                raise KeyError(i)
+            rows = store.sentence_rows(store.sentence_of[r])
+            return store.ids[rows[store.heads[rows] == 0]].tolist()
         subset_df = self.df[self.df["Sentence_ID"] == self.sentence_id(i)]
         return list(subset_df[subset_df["Head"] == 0].index)
         #returns the "top" of the sentence of the current token, that is, the tokens
         # which are immediately subordinate to the root(0)
 
     def subset(self, column, i):
+        if self.compact and column in self.df.columns:
+            store = self.store()
+            try:
+                return store.ids[store.postings(column, i)].tolist()
+            except TypeError:
+                pass
         return list(self.df[self.df[column] == i].index)
-        #a more general function for filtering a dataframe based on a column
+        #a more general function for filtering a dataframe based on a column;
+        # answered from an inverted index of the column where possible
 
     def regex_subset(self, column, i):
+        if self.compact and column in self.df.columns:
+            store = self.store()
+            try:
+                rows = store.regex_postings(column, i)
+            except TypeError:
+                rows = None
+            if rows is not None:
+                return store.ids[rows].tolist()
         return list(self.df[self.df[column].str.contains(i, regex=True)].index)
-        #a more general function for filtering a dataframe based on a column, using regex
+        #a more general function for filtering a dataframe based on a column, using
+        # regex; the regex is run over the distinct values of the column only
         
     def information(self, column, i):
-        try:
-            return self.df.loc[[i]][column].item()
-        except:
-            return ""
+        return self.lookup(column, i)
         #a flexible function for retrieving any piece of information for a single token
 
+    def info_many(self, column, ids):
+        return self.store().values(column, ids)
+        #retrieves a column for a whole list/array of token_ids in one go, as an
+        # array aligned with the ids; missing tokens give an empty string
+
+    def head_info(self, ids, columns=None, frame=None, suffix="_head"):
+        store = self.store()
+        ids = np.asarray(ids)
+        heads = store.parents(ids)
+        if frame is None:
+            frame = self.df
+            rows = store.rows(heads)
+        else:
+            rows = frame.index.get_indexer(heads)
+        found = (rows >= 0) & (heads != 0)
+        info = frame.iloc[rows[found]]
+        info = info[list(frame.columns) if columns is None else columns]
+        info.columns = [c + suffix for c in info.columns]
+        info.index = ids[found]
+        return info
+        #returns the chosen columns (all by default) of the heads of a list of
+        # tokens, suffixed and indexed by the dependent token, for joining onto a
+        # frame of dependents; frame can be a filtered or enriched copy of the
+        # corpus to take the columns from, and tokens whose head isn't in it are
+        # left out (as with an inner merge on Head)
+
+    def precedence(self, first, second, column="Token_position"):
+        def positions(lists):
+            lists = [l if isinstance(l, (list, tuple, np.ndarray, pd.Series)) else [l] for l in lists]
+            lengths = np.array([len(l) for l in lists], dtype=np.int64)
+            flat = np.array([i for l in lists for i in l])
+            values = pd.Series(self.info_many(column, flat), dtype=object)
+            codes, uniques = pd.factorize(values, use_na_sentinel=False)
+            numbers = np.array([integer(v) for v in uniques] + [np.nan], dtype=float)[codes]
+            group = np.repeat(np.arange(len(lists)), lengths)
+            low = np.full(len(lists), np.inf)
+            high = np.full(len(lists), -np.inf)
+            np.fmin.at(low, group, numbers)
+            np.fmax.at(high, group, numbers)
+            invalid = np.bincount(group, weights=np.isnan(numbers), minlength=len(lists)) > 0
+            return low, high, invalid, lengths > 0
+        first, second = list(first), list(second)
+        low_1, high_1, invalid_1, full_1 = positions(first)
+        low_2, high_2, invalid_2, full_2 = positions(second)
+        valid = ~invalid_1 & ~invalid_2 & full_1 & full_2
+        output = np.full(len(first), None, dtype=object)
+        output[valid & (high_1 < low_2)] = 1
+        output[valid & (high_2 < low_1)] = 0
+        return output
+        #for two aligned lists of token lists (or single tokens), returns 1 where
+        # all tokens of the first precede all tokens of the second, 0 where they
+        # all follow them, and None where the lists overlap, are empty or hold a
+        # token without an integer position; the positions of all tokens are
+        # gathered at once and reduced per list
+
+    def relations(self, ids):
+        return self.info_many("Relation", ids)
+        #returns the relations of a list of tokens as an array
+
+    def lemmas(self, ids):
+        return self.info_many("Lemma", ids)
+        #returns the lemmas of a list of tokens as an array
+
+    def direct_tree_parents(self, ids):
+        return self.store().parents(ids)
+        #returns the direct topological parents of a list of tokens as an array
+        # of integers (0 where missing)
+
 
     ### 2 ### TOPOLOGICAL "DUMB" FUNCTIONS
     def direct_tree_parent(self, i):
+        if self.compact:
+            return self.store().parent(i)
         try:
             return int(self.df.loc[[i]]["Head"])
         except:
@@ -201,12 +931,21 @@ class TreeSearch:
         #returns the direct topological parent of the current token as an integer
 
     def tree_parents(self, i):
+        if self.compact and i != 0:
+            store = self.store()
+            store.euler_tour()
+            r = store.row(i)
+            if r < 0:
+                return [0]
+            if store.depth[r] >= 0:
+                return store.ancestors(r)
         l = []
         while i != 0:
             i = self.direct_tree_parent(i)
             l.append(i)
         return l
         #returns a consecutive list of topological parents to the root of the tree
+        # (read off the precomputed depth arrays where the tree has no loop)
 
     def same_tree_parents(self, i):
         r = self.relation(i)
@@ -222,30 +961,53 @@ class TreeSearch:
         # functions)
 
     def direct_tree_children(self, i):
+        if self.compact:
+            return self.store().children(i)
         return list(self.df[self.df["Head"] == i].index)
         #returns all direct topological children of the current token
 
     def tree_children(self, i):
+        if self.compact:
+            store = self.store()
+            store.euler_tour()
+            r = store.row(i)
+            if r >= 0 and store.depth[r] >= 0:
+                return store.ids[store.descendants(r)].tolist()
         l = self.direct_tree_children(i)
-        while True:
-            check = l
-            l = [l] + [self.direct_tree_children(i) for i in l]
-            l = collapse(l)
-            if l == check:
-                break
+        seen = set(l)
+        k = 0
+        while k < len(l):
+            for j in self.direct_tree_children(l[k]):
+                if j not in seen:
+                    seen.add(j)
+                    l.append(j)
+            k += 1
         return l
-        #returns all topological children of the current token
+        #returns all topological children of the current token, generation by
+        # generation
+
+    def is_descendant(self, j, i):
+        if self.compact:
+            store = self.store()
+            store.euler_tour()
+            r, q = store.row(i), store.row(j)
+            if r >= 0 and q >= 0 and store.depth[r] >= 0:
+                return bool(store.entry[r] < store.entry[q] <= store.exit[r])
+        return j in self.tree_children(i)
+        #checks whether token j lies anywhere below token i, in constant time
+        # from the depth-first numbering
 
     def same_tree_children(self, i):
         r = self.relation(i)
-        l = []
         l = self.check_relation(r,self.direct_tree_children(i))
-        while True:
-            check = l
-            l = [l] + [self.check_relation(r,self.direct_tree_children(i)) for i in l]
-            l = collapse(l)
-            if l == check:
-                break
+        seen = set(l)
+        k = 0
+        while k < len(l):
+            for j in self.check_relation(r,self.direct_tree_children(l[k])):
+                if j not in seen:
+                    seen.add(j)
+                    l.append(j)
+            k += 1
         return l
         #returns contiguous topological children with the same relation
 
@@ -276,7 +1038,7 @@ class TreeSearch:
             y = [y]
         if isinstance(x, int):
             x = [x]
-        l = list(self.df[self.df["Sentence_ID"] == s].index)    
+        l = self.sentence_tokens(s)
         pedigree = []
         for i in l:
             p = [str(self.token(i)), str(self.relation(i)), "$", str(i)] + [str(i) for i in self.tree_parents(i)]
@@ -310,20 +1072,43 @@ class TreeSearch:
         # OBJ_CO. Important for subsequent functions.
 
     def check_coord(self, i):
+        if self.compact:
+            return remember(self.store().coord_relations, i, lambda: self.coord_relation(i), limit=100000)
+        return self.coord_relation(i)
+        #returns, as a string, the relation that a coordinator is coordinating,
+        # and gives empty string if it doesn't find anything relevant; memoised
+        # in compact mode
+
+    def coord_relation(self, i):
         l = self.direct_aux_children(i)
         try:
             return self.relation([i for i in l if "_CO" in self.relation(i)][0])
         except:
             return ""
-        #returns, as a string, the relation that a coordinator is coordinating,
-        # and gives empty string if it doesn't find anything relevant
+        #uncached version of the above
+
+    def coordination(self, i):
+        def analyse():
+            r = self.check_coord(i)
+            def related(l):
+                return [i for i in l if self.check_coord(i) == r or self.check_coord(i) == "" or r == ""]
+            up = related(self.same_tree_parents(i) + [i])
+            down = related(self.same_tree_children(i) + [i])
+            co = [j for j in collapse([self.direct_tree_children(c) for c in down]) if self.check_if_co(j,r) == True]
+            aux_co = [j for j in collapse([self.direct_aux_children(c) for c in down]) if self.relation(j) == r]
+            return {"relation": r, "coord": down[:-1] + up, "up": up, "down": down, "co": co, "aux_co": aux_co}
+        if self.compact:
+            return remember(self.store().coordinations, i, analyse, limit=100000)
+        return analyse()
+        #analyses a COORD token in one go: the relation it coordinates, the
+        # related coordinators above and/or below it, and its coordinands (with
+        # and without their auxes); memoised in compact mode, and dropped along
+        # with the TokenStore if self.df is replaced
 
     def get_coord(self, i):
         if self.relation(i) != "COORD":
             return ""
-        r = self.check_coord(i)
-        l = self.same_tree_children(i) + self.same_tree_parents(i) + [i]
-        return [i for i in l if self.check_coord(i) == r or self.check_coord(i) == "" or r == ""]
+        return list(self.coordination(i)["coord"])
         #gets subordinate or superordinate coordinators for the same relation; if
         # it's not sure whether a coordinator is related it will give the benefit 
         # of the doubt
@@ -331,37 +1116,33 @@ class TreeSearch:
     def get_coord_up(self, i):
         if self.relation(i) != "COORD":
             return ""
-        r = self.check_coord(i)
-        l = self.same_tree_parents(i) + [i]
-        return [i for i in l if self.check_coord(i) == r or self.check_coord(i) == "" or r == ""]
+        return list(self.coordination(i)["up"])
         #same as above but only searches upwards
 
     def get_coord_down(self, i):
         if self.relation(i) != "COORD":
             return ""
-        r = self.check_coord(i)
-        l = self.same_tree_children(i) + [i]
-        return [i for i in l if self.check_coord(i) == r or self.check_coord(i) == "" or r == ""]
+        return list(self.coordination(i)["down"])
         #same as above but only searches downwards
 
     def direct_co_children(self, i):
-        c = self.get_coord_down(i)
-        r = self.check_coord(i)
-        l = collapse([self.direct_tree_children(i) for i in c])
-        return [i for i in l if self.check_if_co(i,r) == True]
+        if self.relation(i) != "COORD":
+            return []
+        return list(self.coordination(i)["co"])
         #finds tokens which are coordinated by a COORD, including subordinate
         # coordinators, where relevant fetching the token_id of their aux instead;
         # returns empty list if it can't interpret the token as a coord
 
     def direct_aux_co_children(self, i):
-        c = self.get_coord_down(i)
-        r = self.check_coord(i)
-        l = collapse([self.direct_aux_children(i) for i in c])
-        return [i for i in l if self.relation(i) == r]
+        if self.relation(i) != "COORD":
+            return []
+        return list(self.coordination(i)["aux_co"])
         #ditto but ignores the aux and instead gets the token_id of the coordinand
 
     def direct_nonco_children(self, i):
-        c = self.get_coord_up(i)
+        if self.relation(i) != "COORD":
+            return []
+        c = self.coordination(i)["up"]
         r = self.check_coord(i)
         l = collapse([self.direct_tree_children(i) for i in c])
         l = [i for i in l if self.check_if_co(i,r) == False]
@@ -372,7 +1153,9 @@ class TreeSearch:
         # a token as a coord just gets regular direct topological children
     
     def direct_aux_nonco_children(self, i):
-        c = self.get_coord_up(i)
+        if self.relation(i) != "COORD":
+            return []
+        c = self.coordination(i)["up"]
         r = self.check_coord(i)
         l = collapse([self.direct_aux_children(i) for i in c])
         l = [i for i in l if self.relation(i) != r]
@@ -408,24 +1191,48 @@ class TreeSearch:
                 return child
         elif self.relation(i) == "COORD":
             return self.direct_aux_co_children(i)
+        elif self.compact:
+            store = self.store()
+            r = store.row(i)
+            if r < 0:
+                raise KeyError(i)
+            l = self.smart_children_map(store.sentence_of[r]).get(i, [])
+            return [i for i in l if self.relation(i) != "COORD" and "Aux" not in self.relation(i)]
         else:
             l = [j for j in self.sentence(i) if i in self.smart_parents(j)]
             return [i for i in l if self.relation(i) != "COORD" and "Aux" not in self.relation(i)]
         #gets the syntactic children you really want, ignoring COORD and Aux whilst
         # understanding what they mean syntactically
 
+    def smart_children_map(self, n):
+        store = self.store()
+        def invert():
+            m = {}
+            for j in store.ids[store.sentence_rows(n)].tolist():
+                for p in dict.fromkeys(self.smart_parents(j)):
+                    m.setdefault(p, []).append(j)
+            return m
+        return remember(store.smart_children_maps, int(n), invert, limit=1000)
+        #inverts smart_parents for a whole sentence (given by its number in the
+        # sentence index) in one pass, so that smart_children doesn't have to
+        # recompute smart_parents for every token in the sentence; cached
+
     def smart_siblings(self, i):
         if "_CO" in self.relation(i):
-            p = self.direct_aux_parent(i)
-            c = self.get_coord(p)
-            r = self.check_coord(p)
-            l = collapse([self.direct_aux_children(i) for i in c])
-            return [i for i in l if self.relation(i) == r]
+            return self.coordinated_siblings(self.direct_aux_parent(i))
         else:
             return [i]
         #gets all coordinated siblings of i, including of sub- or superordinate
         # coordinators (simply returns [i] if there are none)
 
+    def coordinated_siblings(self, p):
+        c = self.get_coord(p)
+        r = self.check_coord(p)
+        l = collapse([self.direct_aux_children(i) for i in c])
+        return [i for i in l if self.relation(i) == r]
+        #gets all coordinands of a coordinator p (the part of smart_siblings that
+        # only depends on the aux-blind parent)
+
     def constituent(self, i):
         l = self.smart_siblings(i)
         output = l
@@ -435,9 +1242,76 @@ class TreeSearch:
         return list(dict.fromkeys(output))
 
 
-    ### 5 ### DIAGNOSING DISEASED TREES
+    ### 5 ### WHOLE-CORPUS SMART FUNCTIONS
+    def smart_parents_many(self, ids=None):
+        store = self.store()
+        index = self.df.index if ids is None else ids
+        rows = store.rows(store.ids if ids is None else np.asarray(ids))
+        relation = store.codes.get("Relation", np.full(store.size, -1, dtype=np.int32))
+        empty = store.relation_code("")
+        coord = store.coordinated_relations()
+        coord = np.where(coord < 0, empty, coord)
+        output = [[0] for k in range(len(rows))]
+        todo = np.flatnonzero(rows >= 0)
+        i_rows = rows[todo]
+        p = store.heads[i_rows]
+        p_rows = store.head_row[i_rows]
+        coordinands = {}
+        for step in range(store.size + 1):
+            if len(todo) == 0:
+                break
+            inside = p_rows >= 0
+            safe = np.maximum(p_rows, 0)
+            at_coord = inside & store.coord[safe]
+            r = coord[safe]
+            is_co = (r >= 0) & ((relation[i_rows] == r) | (store.aux[i_rows] & store.has_child_relation(i_rows, r)))
+            climb = (at_coord & is_co) | (inside & ~at_coord & store.aux[safe])
+            for k in np.flatnonzero(at_coord & ~is_co).tolist():
+                q = int(p[k])
+                if q not in coordinands:
+                    coordinands[q] = self.direct_aux_co_children(q)
+                output[todo[k]] = list(coordinands[q])
+            for k in np.flatnonzero(~climb & ~at_coord & (p != 0)).tolist():
+                output[todo[k]] = [int(p[k])]
+            todo, i_rows = todo[climb], i_rows[climb]
+            p = store.heads[p_rows[climb]]
+            p_rows = store.head_row[p_rows[climb]]
+        for k in todo.tolist():
+            output[k] = []
+        return pd.Series(output, index=index, dtype=object)
+        #computes smart_parents for every token (or for a list of token_ids) in
+        # one walk up the head array, all tokens climbing in step; returns a
+        # Series of lists aligned with the ids, ready to be attached to a
+        # dataframe; tokens caught in a loop get an empty list rather than
+        # hanging
+
+    def smart_siblings_many(self, ids=None):
+        store = self.store()
+        index = self.df.index if ids is None else ids
+        ids = store.ids if ids is None else np.asarray(ids)
+        rows = store.rows(ids)
+        output = [[i] for i in ids.tolist()]
+        todo = np.flatnonzero(rows >= 0)
+        todo = todo[store.co[rows[todo]]]
+        p = store.heads[rows[todo]]
+        p_rows = store.head_row[rows[todo]]
+        via_aux = p_rows >= 0
+        via_aux[via_aux] = store.aux[p_rows[via_aux]]
+        p[via_aux] = store.heads[p_rows[via_aux]]
+        siblings = {}
+        for k, q in zip(todo.tolist(), p.tolist()):
+            if q not in siblings:
+                siblings[q] = self.coordinated_siblings(q)
+            output[k] = list(siblings[q])
+        return pd.Series(output, index=index, dtype=object)
+        #computes smart_siblings for every token (or for a list of token_ids) at
+        # once: the aux-blind parent is found with array operations, and the
+        # coordinands are worked out once per coordinator
+
+
+    ### 6 ### DIAGNOSING DISEASED TREES
     def check_tree_root(self, s):
-        if 0 in list(self.df[self.df["Sentence_ID"] == s]["Head"]) == False:
+        if 0 in list(self.sentence_frame(s)["Head"]) == False:
             print("This tree appears to lack a root")
             return False
         else:
@@ -446,7 +1320,7 @@ class TreeSearch:
         # resilient to unrooted branches
         
     def check_tree_complete_heads(self, s):
-        if all(isinstance(item, int) for item in list(self.df[self.df["Sentence_ID"] == s]["Head"])):
+        if all(isinstance(item, (int, np.integer)) for item in list(self.sentence_frame(s)["Head"])):
             return True
         else:
             print("Not all tokens in this tree have valid heads")
@@ -454,7 +1328,7 @@ class TreeSearch:
         #checks if tree contains all requisite heads; can be ignored
         
     def check_tree_complete_relations(self, s):
-        if all(isinstance(item, str) for item in list(self.df[self.df["Sentence_ID"] == s]["Relation"])):
+        if all(isinstance(item, str) for item in list(self.sentence_frame(s)["Relation"])):
             return True
         else:
             print("Not all tokens in this tree have valid relations")
@@ -462,7 +1336,14 @@ class TreeSearch:
         #checks if tree contains all requisite relations; can be ignored
         
     def check_tree_loops(self, s):
-        l = list(self.df[self.df["Sentence_ID"] == s].index)
+        if self.compact:
+            store = self.store()
+            store.euler_tour()
+            if (store.depth[store.sentence_rows(store.sentence_number(s))] < 0).any():
+                print("This tree appears to contain a loop")
+                return False
+            return True
+        l = self.sentence_tokens(s)
         for i in l:
             loop = []
             while i != 0:
@@ -476,7 +1357,7 @@ class TreeSearch:
         # a loop breaker, otherwise it will repeat infinitely
 
     def check_tree_aux_children(self, s):
-        l = list(self.df[self.df["Sentence_ID"] == s].index)
+        l = self.sentence_tokens(s)
         l = [i for i in l if "Aux" in self.relation(i)]
         for i in l:
             if len(self.direct_tree_children(i)) > 1:
@@ -490,7 +1371,7 @@ class TreeSearch:
         # except for basic topological queries
     
     def check_tree_aux_co(self, s):
-        l = list(self.df[self.df["Sentence_ID"] == s].index)
+        l = self.sentence_tokens(s)
         l = [self.relation(i) for i in l]
         for i in l:
             if ("Aux" in i) + ("_CO" in i) + ("COORD" in i) > 1:
@@ -501,7 +1382,7 @@ class TreeSearch:
         # probably best not to ignore except for basic topological queries
         
     def check_tree_coord(self, s):
-        l = list(self.df[self.df["Sentence_ID"] == s].index)
+        l = self.sentence_tokens(s)
         l = [i for i in l if "COORD" in self.relation(i)]
         for i in l:
             if self.check_coord(i) == "":
@@ -510,4 +1391,123 @@ class TreeSearch:
         return True
         #checks if all coordinators are specified; can be ignored but might misbehave
         # with queries that are sensitive to coordination phenomena
-      
\ No newline at end of file
+
+    def validate(self):
+        store = self.store()
+        store.euler_tour()
+        children = np.diff(store.child_offsets)
+        stacked = np.zeros(store.size, dtype=bool)
+        child = store.child_rows
+        stacked[store.head_row[child[store.aux[child]]]] = True
+        malformed = store.aux.astype(int) + store.co + store.coordinator > 1
+        rooted = np.zeros(len(store.sentence_index), dtype=bool)
+        rooted[store.sentence_of[store.heads == 0]] = True
+        checks = [("root", np.zeros(store.size, dtype=bool)),
+                  ("complete_heads", ~conforms(self.df["Head"], (int, np.integer))),
+                  ("complete_relations", ~conforms(self.df["Relation"], str)),
+                  ("loops", store.depth < 0),
+                  ("aux_children", store.aux & ((children > 1) | stacked)),
+                  ("aux_co", malformed),
+                  ("coord", store.coordinator & (store.coordinated_relations() < 0))]
+        frames = [pd.DataFrame({"Sentence": np.flatnonzero(~rooted), "Check": 0,
+                                "Tokens": [[] for n in range(int((~rooted).sum()))]})]
+        for k, (name, rows) in enumerate(checks[1:], 1):
+            rows = np.flatnonzero(rows)
+            grouped = pd.Series(store.ids[rows]).groupby(store.sentence_of[rows], sort=True).agg(list)
+            frames.append(pd.DataFrame({"Sentence": grouped.index, "Check": k, "Tokens": grouped.to_numpy()}))
+        report = pd.concat(frames, ignore_index=True).sort_values(["Sentence", "Check"], kind="stable")
+        return pd.DataFrame({"Sentence_ID": store.sentence_index[report["Sentence"].to_numpy()],
+                             "Check": np.array([checks[k][0] for k in report["Check"]], dtype=object),
+                             "Tokens": report["Tokens"].to_numpy(dtype=object)})
+        #runs all of the above checks over every sentence at once and returns one
+        # row per failed check: the Sentence_ID, the check (root, complete_heads,
+        # complete_relations, loops, aux_children, aux_co or coord) and the
+        # offending tokens (none for root, as a missing root has no one token to
+        # blame); an empty frame means that every tree is healthy
+
+
+
+    ### 7 ### TREE-PATTERN QUERIES
+    def mask(self, conditions):
+        store = self.store()
+        if isinstance(conditions, str):
+            conditions = parse_conditions(conditions)
+        output = np.ones(store.size, dtype=bool)
+        for column, operator, value in conditions:
+            if column in store.codes:
+                output &= compare(store.categories[column], operator, value)[store.codes[column]]
+            elif column in self.df.columns:
+                output &= compare(store.column(column), operator, value)
+            else:
+                raise KeyError(column)
+        return output
+        #evaluates conditions such as "Relation~OBJ & Part_of_speech!=verb" for
+        # every token at once, as a boolean array in corpus order; encoded
+        # columns are tested once per distinct value and spread out by code
+
+    def related(self, relation, ids):
+        store = self.store()
+        ids = np.asarray(ids)
+        if relation == "parent":
+            l = [[p] if p != 0 else [] for p in store.parents(ids).tolist()]
+        elif relation == "child":
+            l = [self.direct_tree_children(i) for i in ids.tolist()]
+        elif relation == "smart_parent":
+            l = [[p for p in q if p != 0] for q in self.smart_parents_many(ids).tolist()]
+        elif relation == "smart_child":
+            l = [self.smart_children(i) for i in ids.tolist()]
+        elif relation == "smart_sibling":
+            l = [[j for j in q if j != i] for i, q in zip(ids.tolist(), self.smart_siblings_many(ids).tolist())]
+        elif relation == "ancestor":
+            l = [[p for p in self.tree_parents(i) if p != 0] for i in ids.tolist()]
+        elif relation == "descendant":
+            l = [self.tree_children(i) for i in ids.tolist()]
+        elif relation in ["precedes", "follows"]:
+            positions = pd.to_numeric(pd.Series(store.column("Token_position")), errors="coerce").to_numpy()
+            l = []
+            for r in store.rows(ids).tolist():
+                rows = store.sentence_rows(store.sentence_of[r]) if r >= 0 else np.zeros(0, dtype=np.int32)
+                later = positions[rows] > positions[r] if relation == "precedes" else positions[rows] < positions[r]
+                l.append(store.ids[rows[later]].tolist())
+        else:
+            raise ValueError("unknown relation {!r}".format(relation))
+        return l
+        #returns, for each token in ids, the list of tokens it stands in a
+        # relation to: parent, child, smart_parent, smart_child, smart_sibling,
+        # ancestor, descendant, precedes or follows (within the sentence)
+
+    def match(self, nodes, relations=()):
+        store = self.store()
+        masks = {v: self.mask(c) for v, c in nodes.items()}
+        first = relations[0][0] if len(relations) > 0 else list(nodes)[0]
+        table = pd.DataFrame({first: store.ids[masks[first]]})
+        for a, relation, b in relations:
+            if a in table.columns:
+                sources = pd.unique(table[a].to_numpy())
+            elif b in table.columns:
+                sources = store.ids[masks[a]]
+            else:
+                raise ValueError("{} {} {} isn't connected to the earlier part of the pattern".format(a, relation, b))
+            targets = self.related(relation, sources)
+            lengths = np.array([len(t) for t in targets], dtype=np.int64)
+            pairs = pd.DataFrame({a: np.repeat(sources, lengths),
+                                  b: np.array([j for t in targets for j in t], dtype=store.ids.dtype)})
+            rows = store.rows(pairs[b].to_numpy())
+            pairs = pairs[(rows >= 0) & masks[b][np.maximum(rows, 0)]]
+            on = [i for i in [a, b] if i in table.columns]
+            table = table.merge(pairs.drop_duplicates(), on=on)
+        missing = [v for v in nodes if v not in table.columns]
+        if len(missing) > 0:
+            raise ValueError("{} isn't connected to the rest of the pattern".format(", ".join(missing)))
+        return table[list(nodes)].drop_duplicates().reset_index(drop=True)
+        #finds every match of a tree pattern: nodes maps variables to conditions
+        # and relations is a list of (variable, relation, variable) triples,
+        # followed in order; returns a table with a column of token_ids per
+        # variable and a row per match, e.g. objects with their verbal heads:
+        # match({"x": "Relation~OBJ", "v": "Part_of_speech=verb"},
+        #       [("x", "smart_parent", "v")])
+
+    def query(self, pattern):
+        return self.match(*parse_pattern(pattern))
+        #the same, for a pattern written as text, e.g.
+        # query("x: Relation~OBJ; v: Part_of_speech=verb; x smart_parent v")